@@ -0,0 +1,324 @@
+"""
+Benchmarks for encoding and decoding every media type, over the sample media bundled with the repo and
+cover images scaled up to 1, 12 and 50 megapixels. Run it from this directory:
+
+    python -m benchmark --output results.json
+    python -m benchmark --baseline results.json
+
+Every case sweeps lsb 1-8 and payload sizes from payload.txt up to the capacity of the cover, and records the
+time, payload bytes/s, cover MB/s and peak RSS. With --baseline the results are compared against an earlier run
+and the exit code is 1 if any case got slower than the tolerance allows.
+
+Every run also imports steganography in fresh interpreters with -X importtime, on its own and for an image and an
+audio job, and fails if that loads a media backend the job does not need (e.g. the video libraries for an image):
+
+    python -m benchmark --imports-only
+
+It also encodes a two frame payload into the sample video with two worker processes, and fails if that does not
+finish in time (worker processes holding on to an ffmpeg pipe hang the encode). --imports-only runs that too.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from steganography import Steganography
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DIR = os.path.join(CODE_DIR, os.pardir)
+
+# name: (cover file, extra keyword arguments for Steganography.encode)
+MEDIA = {
+    "image": ("cover_image.png", {}),
+    "audio": ("cover_audio.wav", {}),
+    "gif": ("stego_gif.gif", {}),
+    "gif-palette": ("stego_gif.gif", {"gif_mode": 'palette'}),
+    "video": ("big_buck_bunny_720p_1mb.mp4", {}),
+}
+# cover_image.png scaled up to these sizes (megapixels)
+SYNTHETIC_MEGAPIXELS = (1, 12, 50)
+# payload sizes as fractions of the cover capacity, on top of payload.txt
+PAYLOAD_FRACTIONS = (0.01, 0.1, 0.5, 1.0)
+# slowdowns smaller than this are timer noise, whatever the tolerance says
+NOISE_SECONDS = 0.005
+
+# modules (and their submodules) only the GIF and video paths need
+VIDEO_MODULES = ('moviepy', 'imageio', 'imageio_ffmpeg', 'concurrent.futures.process', 'multiprocessing.shared_memory')
+# name: (cover file to encode and decode, or None to only import steganography; modules that must not be loaded)
+IMPORT_CASES = {
+    "import": (None, ('PIL',) + VIDEO_MODULES),
+    "image": ("cover_image.png", VIDEO_MODULES),
+    "audio": ("cover_audio.wav", ('PIL',) + VIDEO_MODULES),
+}
+IMPORT_JOB = """
+import tempfile
+from steganography import Steganography
+Steganography.OPEN_OUTPUT = False
+with tempfile.TemporaryDirectory() as work_dir:
+    result = Steganography.encode({cover!r}, 'import check', 1, work_dir)
+    assert Steganography.decode(result["output_path"], 1)["message"] == 'import check'
+"""
+
+# a payload spilling into a second frame of the sample video, encoded with two worker processes
+WORKER_JOB = """
+import os, tempfile
+from steganography import Steganography
+Steganography.OPEN_OUTPUT = False
+with tempfile.TemporaryDirectory() as work_dir:
+    width, height, _, _ = Steganography.probe_video({cover!r})
+    result = Steganography.encode({cover!r}, os.urandom(width * height * 3 * 2 // 8), 2, work_dir, workers=2)
+    assert result["status"], result["message"]
+"""
+WORKER_TIMEOUT = 300
+
+
+def peak_rss():
+    """
+    Peak resident set size in bytes of this process and its children (e.g. the ffmpeg and frame worker processes)
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak if sys.platform == 'darwin' else peak * 1024 # kilobytes everywhere but macOS
+
+
+def make_synthetic_cover(megapixels, work_dir):
+    """
+    Scale cover_image.png up to roughly the given number of megapixels, keeping its aspect ratio
+    """
+    with Image.open(os.path.join(SAMPLE_DIR, 'cover_image.png')) as img:
+        scale = (megapixels * 1_000_000 / (img.width * img.height)) ** 0.5
+        path = os.path.join(work_dir, f'synthetic_{megapixels}mp.png')
+        img.convert('RGB').resize((round(img.width * scale), round(img.height * scale)), Image.BILINEAR).save(path, compress_level=1)
+    return path
+
+
+def make_payload(size):
+    """
+    Payload of the given size, cut from largepayload.txt (repeated if needed)
+    """
+    with open(os.path.join(SAMPLE_DIR, 'largepayload.txt'), 'rb') as file:
+        text = file.read()
+    return (text * (size // len(text) + 1))[:size]
+
+
+def run_case(case):
+    """
+    Encode and decode one payload in a fresh process, so the peak RSS belongs to this case alone
+    """
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir) # video decoding writes decoded_message.txt to the working directory
+    Steganography.OPEN_OUTPUT = False
+    try:
+        payload = make_payload(case["payload_bytes"])
+        cover_bytes = os.path.getsize(case["cover"])
+
+        start = time.perf_counter()
+        encoded = Steganography.encode(case["cover"], payload, case["lsb"], work_dir, **case["options"])
+        encode_seconds = time.perf_counter() - start
+        if not encoded["status"]:
+            return {**case, "status": False, "message": encoded["message"], "peak_rss": peak_rss()}
+
+        start = time.perf_counter()
+        decoded = Steganography.decode(encoded["output_path"], case["lsb"])
+        decode_seconds = time.perf_counter() - start
+        message = decoded["message"]
+        if decoded["status"] and "output_path" in decoded:
+            with open(decoded["output_path"], 'rb') as file:
+                message = file.read()
+    finally:
+        os.chdir(SAMPLE_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {**case, "status": decoded["status"] and message == payload, "peak_rss": peak_rss()}
+    for operation, seconds in (("encode", encode_seconds), ("decode", decode_seconds)):
+        results[operation] = {
+            "seconds": seconds,
+            "payload_bytes_per_second": case["payload_bytes"] / seconds,
+            "cover_mb_per_second": cover_bytes / 1_000_000 / seconds,
+        }
+    return results
+
+
+def measure_imports(name):
+    """
+    Run an import case in a fresh interpreter with -X importtime. Returns the cumulative import time of
+    steganography and the forbidden modules that got loaded
+    """
+    cover, forbidden = IMPORT_CASES[name]
+    script = "import steganography" if cover is None else IMPORT_JOB.format(cover=os.path.join(SAMPLE_DIR, cover))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=CODE_DIR, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"import case {name} failed:\n{process.stderr[-2000:]}")
+
+    # lines look like "import time:       518 |     177220 |   moviepy.video.io.ffmpeg_reader" (microseconds)
+    seconds, loaded = None, set()
+    for line in process.stderr.splitlines():
+        fields = line.split('|')
+        if not line.startswith('import time:') or not fields[1].strip().isdigit():
+            continue
+        module = fields[2].strip()
+        loaded.add(module)
+        if module == 'steganography':
+            seconds = int(fields[1]) / 1_000_000
+    unexpected = [name for name in forbidden if any(module == name or module.startswith(name + '.') for module in loaded)]
+    return {"seconds": seconds, "unexpected": unexpected}
+
+
+def check_imports(imports):
+    """
+    Import cases that loaded a module they should not have
+    """
+    return [f"{name}: imported {', '.join(result['unexpected'])}" for name, result in imports.items() if result["unexpected"]]
+
+
+def check_workers():
+    """
+    Encode WORKER_JOB in a fresh interpreter. Returns an error if it fails or does not finish in WORKER_TIMEOUT seconds
+    """
+    script = WORKER_JOB.format(cover=os.path.join(SAMPLE_DIR, MEDIA["video"][0]))
+    try:
+        process = subprocess.run([sys.executable, '-c', script], cwd=CODE_DIR, capture_output=True, text=True, timeout=WORKER_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return f"video encode with 2 workers did not finish in {WORKER_TIMEOUT}s"
+    if process.returncode != 0:
+        return f"video encode with 2 workers failed:\n{process.stderr[-2000:]}"
+    return None
+
+
+def plan_cases(media, lsbs, fractions, work_dir):
+    """
+    List every (cover, lsb, payload size) combination to run
+    """
+    covers = {name: (os.path.join(SAMPLE_DIR, cover), options) for name, (cover, options) in MEDIA.items()}
+    for megapixels in SYNTHETIC_MEGAPIXELS:
+        name = f"synthetic-{megapixels}mp"
+        if name in media:
+            covers[name] = (make_synthetic_cover(megapixels, work_dir), {})
+
+    cases = []
+    for name, (cover, options) in covers.items():
+        if name not in media:
+            continue
+        for lsb in lsbs:
+            capacity = Steganography.capacity(cover, lsb, options.get("gif_mode", 'rgb'))
+            if not capacity["status"]:
+                print(f"Skipping {name}: {capacity['message']}", file=sys.stderr)
+                break
+            sizes = {os.path.getsize(os.path.join(SAMPLE_DIR, 'payload.txt'))}
+            sizes.update(max(1, int(capacity["capacity"] * fraction)) for fraction in fractions)
+            for size in sorted(sizes):
+                cases.append({"media": name, "cover": cover, "lsb": lsb, "payload_bytes": size, "options": options})
+    return cases
+
+
+def case_key(case):
+    return (case["media"], case["lsb"], case["payload_bytes"])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Cases that got slower than the baseline by more than tolerance (a fraction), or that stopped round-tripping
+    """
+    previous = {case_key(case): case for case in baseline["cases"]}
+    regressions = []
+    for name, result in results.get("imports", {}).items():
+        before = baseline.get("imports", {}).get(name)
+        if before is None:
+            continue
+        seconds, baseline_seconds = result["seconds"], before["seconds"]
+        if seconds > baseline_seconds * (1 + tolerance) and seconds - baseline_seconds > NOISE_SECONDS:
+            regressions.append(f"{name} import: {seconds:.3f}s vs {baseline_seconds:.3f}s baseline (+{(seconds / baseline_seconds - 1) * 100:.0f}%)")
+    for case in results["cases"]:
+        before = previous.get(case_key(case))
+        if before is None or not before["status"]:
+            continue
+        if not case["status"]:
+            regressions.append(f"{case['media']} lsb={case['lsb']} {case['payload_bytes']}B: no longer round-trips ({case.get('message', 'payload mismatch')})")
+            continue
+        for operation in ("encode", "decode"):
+            seconds, baseline_seconds = case[operation]["seconds"], before[operation]["seconds"]
+            if seconds > baseline_seconds * (1 + tolerance) and seconds - baseline_seconds > NOISE_SECONDS:
+                regressions.append(f"{case['media']} lsb={case['lsb']} {case['payload_bytes']}B {operation}: "
+                                   f"{seconds:.3f}s vs {baseline_seconds:.3f}s baseline (+{(seconds / baseline_seconds - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    media_names = list(MEDIA) + [f"synthetic-{megapixels}mp" for megapixels in SYNTHETIC_MEGAPIXELS]
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description="Benchmark encoding and decoding over the sample media")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file to write the results to")
+    parser.add_argument('--baseline', help="earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument('--media', nargs='+', default=media_names, choices=media_names)
+    parser.add_argument('--lsb', nargs='+', type=int, default=list(range(1, 9)), choices=range(1, 9))
+    parser.add_argument('--fractions', nargs='+', type=float, default=list(PAYLOAD_FRACTIONS), help="payload sizes as fractions of capacity")
+    parser.add_argument('--imports-only', action='store_true', help="only run the import and worker checks")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "imports": {},
+        "cases": [],
+    }
+    for name in IMPORT_CASES:
+        result = results["imports"][name] = measure_imports(name)
+        print(f"[import] {name}: {result['seconds']:.3f}s" + (f", imported {', '.join(result['unexpected'])}" if result["unexpected"] else ""), file=sys.stderr)
+
+    worker_error = check_workers()
+    print(f"[workers] video, 2 workers: {worker_error or 'ok'}", file=sys.stderr)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        cases = [] if args.imports_only else plan_cases(args.media, args.lsb, args.fractions, work_dir)
+        for index, case in enumerate(cases):
+            # one process per case, so the peak RSS of one case does not carry over to the next
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, case).result()
+            results["cases"].append(result)
+            summary = f"{result['encode']['seconds']:.3f}s / {result['decode']['seconds']:.3f}s" if result["status"] else result.get("message", "payload mismatch")
+            print(f"[{index + 1}/{len(cases)}] {case['media']} lsb={case['lsb']} {case['payload_bytes']}B: {summary}", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    # loading a backend the job does not need, or a hanging worker pool, is a regression with or without a baseline
+    check_errors = check_imports(results["imports"]) + ([worker_error] if worker_error else [])
+    if check_errors:
+        print(f"{len(check_errors)} check(s) failed:", file=sys.stderr)
+        for error in check_errors:
+            print(f"  {error}", file=sys.stderr)
+        return 1
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+        print(f"No regressions against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Headless command line front end to Steganography. Results are printed to stdout as JSON and encoded files
+are never opened in a viewer, so it can be driven from scripts. Set STEGANOGRAPHY_EVENTS to a file path to
+record timed stage events as JSON lines. Run it from this directory:
+
+    python -m cli encode COVER PAYLOAD --lsb 2 --output OUT
+    python -m cli decode STEGO --lsb 2 [--output FILE]
+    python -m cli capacity COVER --lsb 2
+    python -m cli batch MANIFEST --jobs 4
+
+A batch manifest is a CSV file with cover, payload and output columns (plus optional lsb, audio_mode and
+gif_mode columns), or a JSONL file with one object per line using the same keys.
+"""
+import argparse
+import base64
+import csv
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from steganography import Steganography
+
+# never open encoded files in a viewer
+Steganography.OPEN_OUTPUT = False
+
+
+def read_payload(payload_path):
+    """
+    Text files are hidden as text, anything else as raw bytes (the same as the encoder window)
+    """
+    if payload_path.endswith('.txt'):
+        with open(payload_path, 'r', encoding='utf-8') as file:
+            return file.read()
+    return pathlib.Path(payload_path)
+
+
+def encode(cover, payload, output, lsb, workers=None, audio_mode='stream', gif_mode='rgb', message=None):
+    """
+    Encode a payload file (or a message) into the cover. output is either a directory, which keeps the default
+    output file name, or the path of the stego file to write
+    """
+    msg = message if message is not None else read_payload(payload)
+    if os.path.isdir(output):
+        return Steganography.encode(cover, msg, lsb, output, workers, audio_mode, gif_mode)
+
+    # Encode into a scratch directory next to the output, then move the file into place
+    output_dir = os.path.dirname(os.path.abspath(output))
+    os.makedirs(output_dir, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(dir=output_dir)
+    try:
+        result = Steganography.encode(cover, msg, lsb, scratch_dir, workers, audio_mode, gif_mode)
+        # in-place audio encoding writes to the cover itself
+        if result["status"] and os.path.dirname(os.path.abspath(result["output_path"])) == scratch_dir:
+            os.replace(result["output_path"], output)
+            result["output_path"] = output
+        return result
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def decode(stego, lsb, output=None):
+    """
+    Decode the payload from a stego file. Text payloads are returned in the result, binary payloads are
+    written to output if given and returned base64 encoded otherwise
+    """
+    result = Steganography.decode(stego, lsb)
+    if not result["status"]:
+        return result
+
+    if "output_path" in result: # video payloads are written to a file
+        if output is not None:
+            shutil.move(result["output_path"], output)
+            result.update(message=f"Payload written to {output}", output_path=output)
+        return result
+    payload = result["message"]
+    if output is not None:
+        with open(output, 'wb') as file:
+            file.write(payload.encode('utf-8') if isinstance(payload, str) else payload)
+        return {"status": True, "message": f"Payload written to {output}", "output_path": output, "size": len(payload)}
+    if isinstance(payload, bytes):
+        return {"status": True, "message": "Binary payload", "payload_base64": base64.b64encode(payload).decode('ascii'), "size": len(payload)}
+    return result
+
+
+def read_manifest(manifest_path):
+    """
+    Read the jobs of a CSV or JSONL batch manifest as dicts
+    """
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as file:
+        if manifest_path.endswith(('.jsonl', '.ndjson')):
+            return [json.loads(line) for line in file if line.strip()]
+        return list(csv.DictReader(file))
+
+
+def run_job(job):
+    """
+    Run one batch job in a pool worker. The result is tagged with the job it came from
+    """
+    try:
+        result = encode(job["cover"], job["payload"], job["output"], int(job["lsb"]), 1,
+                        job.get("audio_mode") or 'stream', job.get("gif_mode") or 'rgb')
+    except Exception as e:
+        result = {"status": False, "message": str(e)}
+    return {**job, **result}
+
+
+def batch(manifest_path, lsb, jobs=None):
+    """
+    Run every job of the manifest across a process pool, yielding the results in manifest order
+    """
+    manifest = read_manifest(manifest_path)
+    for job in manifest:
+        job["lsb"] = job.get("lsb") or lsb
+    # each job embeds in a single process, the pool spreads the jobs over the CPUs
+    with ProcessPoolExecutor(max_workers=Steganography.worker_count(jobs, len(manifest))) as executor:
+        yield from executor.map(run_job, manifest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cli', description="Hide and recover payloads with LSB steganography")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    encode_parser = subparsers.add_parser('encode', help="Hide a payload in a cover file")
+    encode_parser.add_argument('cover')
+    encode_parser.add_argument('payload', nargs='?', help="payload file (.txt files are hidden as text)")
+    encode_parser.add_argument('--message', help="hide this text instead of a payload file")
+    encode_parser.add_argument('--lsb', type=int, required=True, choices=range(1, 9))
+    encode_parser.add_argument('--output', default='.', help="output directory or stego file path")
+    encode_parser.add_argument('--workers', type=int, help="processes for GIF and video frames")
+    encode_parser.add_argument('--audio-mode', default='stream', choices=('stream', 'mmap', 'in-place'))
+    encode_parser.add_argument('--gif-mode', default='rgb', choices=('rgb', 'palette'))
+
+    decode_parser = subparsers.add_parser('decode', help="Recover a payload from a stego file")
+    decode_parser.add_argument('stego')
+    decode_parser.add_argument('--lsb', type=int, required=True, choices=range(1, 9))
+    decode_parser.add_argument('--output', help="write the payload to this file")
+
+    capacity_parser = subparsers.add_parser('capacity', help="Show how many payload bytes fit in a cover file")
+    capacity_parser.add_argument('cover')
+    capacity_parser.add_argument('--lsb', type=int, required=True, choices=range(1, 9))
+    capacity_parser.add_argument('--gif-mode', default='rgb', choices=('rgb', 'palette'))
+
+    batch_parser = subparsers.add_parser('batch', help="Encode every cover/payload/output row of a CSV or JSONL manifest")
+    batch_parser.add_argument('manifest')
+    batch_parser.add_argument('--lsb', type=int, default=1, choices=range(1, 9), help="LSBs for rows without an lsb")
+    batch_parser.add_argument('--jobs', type=int, help="number of worker processes (defaults to one per CPU)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        # one JSON result per line, in manifest order
+        status = True
+        for result in batch(args.manifest, args.lsb, args.jobs):
+            status = status and result["status"]
+            print(json.dumps(result), flush=True)
+        return 0 if status else 1
+
+    if args.command == 'encode' and args.payload is None and args.message is None:
+        parser.error("encode needs a payload file or --message")
+    # errors are reported as JSON results like everything else, never as a traceback
+    try:
+        if args.command == 'encode':
+            result = encode(args.cover, args.payload, args.output, args.lsb, args.workers, args.audio_mode, args.gif_mode, args.message)
+        elif args.command == 'decode':
+            result = decode(args.stego, args.lsb, args.output)
+        else:
+            result = Steganography.capacity(args.cover, args.lsb, args.gif_mode)
+    except Exception as e:
+        result = {"status": False, "message": str(e)}
+    print(json.dumps(result))
+    return 0 if result["status"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import struct
+import zlib
+
+# Every payload is stored as HEADER + payload bytes, so a decoder only has to
+# read HEADER.size bytes to know exactly how much more to pull from the cover.
+#   magic (4s) | version (B) | lsb (B) | flags (B) | payload length (Q) | CRC32 of payload (I)
+MAGIC = b'LSBS'
+VERSION = 1
+HEADER = struct.Struct('>4sBBBQI')
+HEADER_SIZE = HEADER.size
+
+# flags
+FLAG_TEXT = 0x01  # payload is UTF-8 text rather than raw binary
+
+
+def pack(payload, lsb, flags=0):
+    """
+    Prefix the payload bytes with the container header
+    """
+    return HEADER.pack(MAGIC, VERSION, lsb, flags, len(payload), zlib.crc32(payload)) + payload
+
+
+def parse_header(data):
+    """
+    Parse the header at the start of data, returns None if data does not start with a container header
+    """
+    if len(data) < HEADER_SIZE:
+        return None
+    magic, version, lsb, flags, length, crc = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        return None
+    if version != VERSION:
+        raise ValueError(f"Unsupported container version: {version}")
+    return {"lsb": lsb, "flags": flags, "length": length, "crc": crc}
+
+
+def verify(header, payload):
+    """
+    Check that the recovered payload matches the length and CRC stored in its header
+    """
+    if len(payload) != header["length"]:
+        raise ValueError(f"Payload truncated: expected {header['length']} bytes, got {len(payload)}")
+    if zlib.crc32(payload) != header["crc"]:
+        raise ValueError("Payload checksum mismatch (wrong number of LSBs or corrupted file?)")
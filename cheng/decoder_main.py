@@ -1,9 +1,9 @@
 from PyQt5.QtWidgets import QFrame, QApplication, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout, QWidget, QScrollArea, QLabel, QFileDialog, QMessageBox, QComboBox, QStackedWidget
 from PyQt5.QtCore import Qt, QUrl
 from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QMouseEvent, QPixmap
-import vlc
-from PIL import Image
+import os
 from steganography import Steganography
+from workers import StegoJob, JobPanel
 
 class FileDropBox(QLabel):
     def __init__(self, valid_extensions, preview_stack, *args, **kwargs):
@@ -11,9 +11,9 @@ class FileDropBox(QLabel):
         self.valid_extensions = valid_extensions
         self.preview_stack = preview_stack
         
-        # VLC player initialization
-        self.instance = vlc.Instance()
-        self.player = self.instance.media_player_new()
+        # VLC is only loaded the first time audio or video is previewed
+        self.instance = None
+        self.player = None
         self.video_widget = QFrame()
         self.preview_stack.addWidget(self.video_widget)
 
@@ -55,17 +55,25 @@ class FileDropBox(QLabel):
                 self.setText(fileName)
                 self.preview_file(fileName)
     
+    def media_player(self):
+        if self.player is None:
+            import vlc
+            self.instance = vlc.Instance()
+            self.player = self.instance.media_player_new()
+        return self.player
+
     def preview_file(self, file_path):
         if file_path is None:
             return
         if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-            self.player.stop()
+            if self.player is not None:
+                self.player.stop()
             pixmap = QPixmap(file_path)
             pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
             self.preview_stack.setCurrentIndex(0)
             self.preview_stack.currentWidget().setPixmap(pixmap)
         elif file_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.wav', '.mp3', '.ogg', '.flac', '.m4a', '.aac')):
-            self.player.stop()
+            self.media_player().stop()
             media = self.instance.media_new(file_path)
             self.player.set_media(media)
             self.player.set_hwnd(int(self.video_widget.winId()))
@@ -80,7 +88,8 @@ class FileDropBox(QLabel):
             self.preview_stack.currentWidget().setText(content)
 
     def handle_error(self):
-        error = self.player.get_state()
+        import vlc
+        error = self.media_player().get_state()
         if error == vlc.State.Error:
             error_message = self.player.get_state()
             print(f"Error: {error_message}")
@@ -151,15 +160,27 @@ def window():
         stegoFilePath = stegoDropBox.text()
         lsb = int(lsbComboBox.currentText())
 
+        # decode on a worker thread, the result is shown once it is done
+        job = StegoJob(f"Decoding {os.path.basename(stegoFilePath)}", Steganography.decode, stegoFilePath, lsb)
+        jobPanel.submit(job, showResult)
+
+    # Result of a decode job
+    def showResult(result):
+        if result.get("cancelled"):
+            return
+
         try:
-            decoder = Steganography()
-            if stegoFilePath.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-                result = decoder.decode_steganography_video(stegoFilePath, lsb)
-            else:
-                result = decoder.decode(stegoFilePath, lsb)
+            message = result.get("message")
+            if isinstance(message, bytes):
+                # binary payload, let the user choose where to save it
+                fileName, _ = QFileDialog.getSaveFileName(win, "Save decoded payload", "decoded_payload.bin")
+                if fileName:
+                    with open(fileName, 'wb') as file:
+                        file.write(message)
+                message = f"Decoded {len(message)} bytes of binary payload" + (f" to {fileName}" if fileName else "")
 
             msgBox = QMessageBox(win)
-            msgBox.setText(result.get("message"))
+            msgBox.setText(message)
             msgBox.setStyleSheet("border: 0px; padding: 10px; height: 100px; width: 300px;")
             
             if result.get("status") is False:
@@ -184,6 +205,10 @@ def window():
     layout.addWidget(button)
     button.clicked.connect(decode)
 
+    # Progress of the running job and the ones queued behind it
+    jobPanel = JobPanel()
+    layout.addWidget(jobPanel)
+
     # Down Arrow Icon
     downArrowIcon = QLabel()
     downArrowmap = QPixmap("./img/down-arrow.png")
@@ -194,6 +219,7 @@ def window():
     downArrowIcon.hide() # hide the arrow first
 
     scroll = QScrollArea()
+    scroll.setWidgetResizable(True) # grow with the job panel when it is shown
     scroll.setWidget(widget)
     win.setCentralWidget(scroll)
 
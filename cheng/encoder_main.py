@@ -1,22 +1,23 @@
 from PyQt5.QtWidgets import (QFrame, QApplication, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout, QWidget, QScrollArea, 
                              QLabel, QFileDialog, QMessageBox, QComboBox, QStackedWidget)
-from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QMouseEvent, QIcon, QPixmap
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtMultimediaWidgets import QVideoWidget
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QMouseEvent, QPixmap
 import os
-import vlc
+import pathlib
 from steganography import Steganography
+from workers import StegoJob, JobPanel
 
 class FileDropBox(QLabel):
-    def __init__(self, valid_extensions, preview_stack, *args, **kwargs):
+    def __init__(self, valid_extensions, preview_stack, *args, accept_any=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.valid_extensions = valid_extensions
+        # take dropped files of any type (valid_extensions then only fill the file dialog's filters)
+        self.accept_any = accept_any
         self.preview_stack = preview_stack
         
-        # VLC player initialization
-        self.instance = vlc.Instance()
-        self.player = self.instance.media_player_new()
+        # VLC is only loaded the first time audio or video is previewed
+        self.instance = None
+        self.player = None
         self.video_widget = QFrame()
         self.preview_stack.addWidget(self.video_widget)
 
@@ -37,7 +38,7 @@ class FileDropBox(QLabel):
             if file_path is None:
                 self.preview_stack.setCurrentWidget(QLabel("Cover File Preview"))
                 return
-            if file_path.lower().endswith(tuple(self.valid_extensions)):
+            if self.accept_any or file_path.lower().endswith(tuple(self.valid_extensions)):
                 self.setText(file_path)
                 self.preview_file(file_path)
             else:
@@ -58,17 +59,25 @@ class FileDropBox(QLabel):
                 self.setText(fileName)
                 self.preview_file(fileName)
     
+    def media_player(self):
+        if self.player is None:
+            import vlc
+            self.instance = vlc.Instance()
+            self.player = self.instance.media_player_new()
+        return self.player
+
     def preview_file(self, file_path):
         if file_path is None:
             return
         if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-            self.player.stop()
+            if self.player is not None:
+                self.player.stop()
             pixmap = QPixmap(file_path)
             pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
             self.preview_stack.setCurrentIndex(0)
             self.preview_stack.currentWidget().setPixmap(pixmap)
         elif file_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.wav', '.mp3', '.ogg', '.flac', '.m4a', '.aac')):
-            self.player.stop()
+            self.media_player().stop()
             media = self.instance.media_new(file_path)
             self.player.set_media(media)
             self.player.set_hwnd(int(self.video_widget.winId()))
@@ -82,7 +91,8 @@ class FileDropBox(QLabel):
             self.preview_stack.currentWidget().setText(content)
 
     def handle_error(self):
-        error = self.player.get_state()
+        import vlc
+        error = self.media_player().get_state()
         if error != vlc.State.Error:
             error_message = self.player.get_state()
             print(f"Error: {error_message}")
@@ -145,7 +155,7 @@ def window():
     payloadDropBoxLayout = QHBoxLayout()
     payloadPreviewStack = QStackedWidget()
     payloadPreviewStack.addWidget(QLabel("Payload File Preview"))  # Add QLabel for text files
-    payloadDropBox = FileDropBox(['.txt'], payloadPreviewStack)
+    payloadDropBox = FileDropBox(['.txt', '.*'], payloadPreviewStack, accept_any=True)
     payloadDropBoxLayout.addWidget(payloadDropBox)
     payloadPreviewStack.setStyleSheet("margin-left: 80px;height: 100px;width: 100px;")
     payloadDropBoxLayout.addWidget(payloadPreviewStack)
@@ -231,11 +241,21 @@ def window():
         print(f"LSB: {lsb}")
         print(f"Output Directory: {output_dir}")
         
-        with open(payloadFilePath, 'r') as file:
-            payload = file.read()
+        # text files are hidden as text, anything else is hidden as raw bytes
+        if payloadFilePath.lower().endswith('.txt'):
+            with open(payloadFilePath, 'r') as file:
+                payload = file.read()
+        else:
+            payload = pathlib.Path(payloadFilePath)
             
-        encoder = Steganography()
-        result = encoder.encode(coverFilePath, payload, lsb, output_dir)
+        # encode on a worker thread, the result is shown once it is done
+        job = StegoJob(f"Encoding {os.path.basename(coverFilePath)}", Steganography.encode, coverFilePath, payload, lsb, output_dir)
+        jobPanel.submit(job, showResult)
+
+    # Result of an encode job
+    def showResult(result):
+        if result.get("cancelled"):
+            return
         
         msgBox = QMessageBox(win)
         msgBox.setText(result.get("message"))
@@ -259,7 +279,12 @@ def window():
     layout.addWidget(button)
     button.clicked.connect(encode)
 
+    # Progress of the running job and the ones queued behind it
+    jobPanel = JobPanel()
+    layout.addWidget(jobPanel)
+
     scroll = QScrollArea()
+    scroll.setWidgetResizable(True) # grow with the job panel when it is shown
     scroll.setWidget(widget)
     win.setCentralWidget(scroll)
 
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Progress messages and timed stage events both go through this logger. Stage events are DEBUG records
+# carrying an `event` dict: {"stage": ..., "seconds": ..., plus byte counts and other fields}
+logger = logging.getLogger('steganography')
+
+# Set to a file path to append every stage event to it as JSON lines, without touching any code
+EVENTS_ENV = 'STEGANOGRAPHY_EVENTS'
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Time a stage of an encode/decode job and emit it as an event when it finishes. Fields known only
+    once the stage has run (byte counts, frame counts) can be added to the yielded dict
+    """
+    event = {"stage": name, **fields}
+    start = time.perf_counter()
+    try:
+        yield event
+    finally:
+        event["seconds"] = time.perf_counter() - start
+        emit(event)
+
+
+class StageTimer:
+    """
+    Add up the time spent in stages that run once per block or frame, and emit one event per stage at the end
+    instead of one per pass:
+
+        timer = StageTimer("load", "embed")
+        for block in blocks:
+            with timer("load"):
+                ...
+        timer.emit(media="audio", bytes=total)
+    """
+    def __init__(self, *names):
+        self.seconds = dict.fromkeys(names, 0.0)
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def emit(self, **fields):
+        for name, seconds in self.seconds.items():
+            emit({"stage": name, "seconds": seconds, **fields})
+
+
+def emit(event):
+    """
+    Emit an event dict to the sinks
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s took %.6fs", event["stage"], event.get("seconds", 0.0), extra={"event": event})
+
+
+class EventSink(logging.Handler):
+    """
+    Base class of the sinks: a logging handler that only sees stage events and hands their dict to handle_event
+    """
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.addFilter(lambda record: hasattr(record, 'event'))
+
+    def emit(self, record):
+        try:
+            self.handle_event(record.event)
+        except Exception:
+            self.handleError(record)
+
+    def handle_event(self, event):
+        raise NotImplementedError
+
+
+class CallbackSink(EventSink):
+    """
+    Call a function with every event dict
+    """
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def handle_event(self, event):
+        self.callback(event)
+
+
+class JSONLSink(EventSink):
+    """
+    Append every event to a file as one JSON object per line
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.file_lock = threading.Lock()
+
+    def handle_event(self, event):
+        line = json.dumps({"time": time.time(), "pid": os.getpid(), **event}, default=str) + '\n'
+        with self.file_lock, open(self.path, 'a') as file:
+            file.write(line)
+
+
+class CollectorSink(EventSink):
+    """
+    Keep the events in memory, in the order they were emitted
+    """
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def handle_event(self, event):
+        self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
+
+
+def add_sink(sink):
+    """
+    Start sending stage events to a sink
+    """
+    logger.addHandler(sink)
+    if logger.level == logging.NOTSET or logger.level > logging.DEBUG:
+        logger.setLevel(logging.DEBUG)
+    return sink
+
+
+def remove_sink(sink):
+    logger.removeHandler(sink)
+
+
+if os.environ.get(EVENTS_ENV):
+    add_sink(JSONLSink(os.environ[EVENTS_ENV]))
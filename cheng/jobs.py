@@ -0,0 +1,47 @@
+import threading
+
+
+class Cancelled(Exception):
+    """
+    Raised inside an encode/decode job when its cancellation token has been set
+    """
+
+
+class CancelToken:
+    """
+    Set by the caller to stop a running job; the job checks it between chunks or frames.
+    Wraps a threading.Event by default, pass a multiprocessing.Event to cancel a job running in another process
+    """
+    def __init__(self, event=None):
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+
+class JobProgress:
+    """
+    Progress of one job: reports (items done, total items, bytes processed) to an optional callback and
+    raises Cancelled at the next update once the token is set. total may be None if it is not known
+    """
+    def __init__(self, callback=None, cancel=None, total=None):
+        self.callback = callback
+        self.cancel = cancel
+        self.total = total
+
+    def check(self):
+        if self.cancel is not None and self.cancel.cancelled:
+            raise Cancelled("Cancelled")
+
+    def update(self, done, processed_bytes):
+        self.check()
+        if self.callback is not None:
+            self.callback(done, self.total, processed_bytes)
+
+
+def cancelled_result():
+    return {"status": False, "message": "Cancelled", "cancelled": True}
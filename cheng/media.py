@@ -0,0 +1,120 @@
+"""
+Registry of the media types payloads can be hidden in. The adapter for a file is picked by sniffing its first
+bytes rather than trusting its extension, so unsupported or mislabelled files are turned away before any work
+is done. steganography.py registers the built-in adapters; more can be added with register().
+"""
+
+# number of bytes read from the start of a file to recognise it
+SNIFF_BYTES = 32
+
+PNG = b'\x89PNG\r\n\x1a\n'
+BMP = b'BM'
+JPEG = b'\xff\xd8\xff'
+GIF = (b'GIF87a', b'GIF89a')
+EBML = b'\x1a\x45\xdf\xa3'  # Matroska / WebM
+
+
+class MediaAdapter:
+    """
+    One media type: how to recognise it, what it can do and the engine functions that handle it.
+      sniff(head) tells whether head, the first SNIFF_BYTES bytes of a file, belongs to this type
+      encode(path, msg, lsb, output_dir, progress, cancel, **options) and decode(path, lsb, progress, cancel, **options)
+      return the usual {"status", "message", ...} dicts
+      capacity(path, **options) returns the number of lsb-wide carrier symbols in the file
+      capabilities holds the operations supported ('encode', 'decode') and the options understood
+      ('workers', 'audio_mode', 'gif_mode', 'tk_layout'); options an adapter does not list are not passed to it.
+      'memory' means encode and decode also take a seekable binary file instead of a path, and encode
+      returns the stego file as bytes when output_dir is None
+    """
+    def __init__(self, name, sniff, capabilities, encode=None, decode=None, capacity=None):
+        self.name = name
+        self.sniff = sniff
+        self.capabilities = frozenset(capabilities)
+        self.encode = encode
+        self.decode = decode
+        self.capacity = capacity
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    def options(self, **options):
+        """
+        The options this adapter understands, out of the ones given
+        """
+        return {name: value for name, value in options.items() if name in self.capabilities}
+
+
+# registered adapters, in the order they are tried
+ADAPTERS = []
+
+
+def register(adapter):
+    """
+    Add a media adapter. Adapters are tried in the order they were registered
+    """
+    ADAPTERS.append(adapter)
+    return adapter
+
+
+def sniff(source):
+    """
+    The adapter for a file, given as a path or a seekable binary file, or None if no registered adapter recognises it
+    """
+    if hasattr(source, 'read'):
+        position = source.tell()
+        head = source.read(SNIFF_BYTES)
+        source.seek(position)
+    else:
+        with open(source, 'rb') as file:
+            head = file.read(SNIFF_BYTES)
+    for adapter in ADAPTERS:
+        if adapter.sniff(head):
+            return adapter
+    return None
+
+
+def lookup(source, operation):
+    """
+    The adapter that can do operation ('encode', 'decode' or 'capacity') on a file given as a path or a binary
+    file. Raises ValueError right away if the file is not a supported type or its type cannot do operation
+    """
+    in_memory = hasattr(source, 'read')
+    adapter = sniff(source)
+    if adapter is None:
+        name = getattr(source, 'name', 'in-memory file') if in_memory else source
+        raise ValueError(f"Unsupported file type: {name} is not one of {', '.join(adapter.name for adapter in ADAPTERS)}")
+    if not adapter.supports('decode' if operation == 'decode' else 'encode'):
+        raise ValueError(f"{adapter.name} files can't be used to {operation}")
+    if in_memory and not adapter.supports('memory'):
+        raise ValueError(f"{adapter.name} files can't be used to {operation} in memory")
+    return adapter
+
+
+def starts_with(*signatures):
+    return lambda head: head.startswith(signatures)
+
+
+def riff(form):
+    """
+    RIFF container of the given form type, e.g. b'WAVE' or b'AVI '
+    """
+    return lambda head: head[:4] == b'RIFF' and head[8:12] == form
+
+
+def iso_media(head):
+    """
+    MP4 / MOV: ISO base media files open with an ftyp box. Audio-only brands (M4A, M4B, M4P) don't count
+    """
+    return head[4:8] == b'ftyp' and head[8:12] not in (b'M4A ', b'M4B ', b'M4P ')
+
+
+def wave_pcm(head):
+    """
+    RIFF/WAVE holding PCM samples. Float and compressed WAVs are turned away when the fmt chunk comes first,
+    as it nearly always does (anything else is left to the WAV reader)
+    """
+    if not riff(b'WAVE')(head):
+        return False
+    if head[12:16] != b'fmt ':
+        return True
+    return int.from_bytes(head[20:22], 'little') in (1, 0xFFFE) # PCM, WAVE_FORMAT_EXTENSIBLE
@@ -1,259 +1,522 @@
-from PIL import Image, ImageSequence
-from moviepy.editor import VideoFileClip, VideoClip
 import numpy as np
 import wave
 import os 
 import subprocess
 import math
-import cv2
+import io
+import threading
+import struct
 import shutil
-import stat
+import container
+import media
+from instrumentation import logger, stage, StageTimer
+from jobs import Cancelled, JobProgress, cancelled_result
+
+# The media backends (Pillow for images and GIFs, moviepy for probing videos) and the process pool used for
+# GIF and video frames are imported by the code paths that need them, so e.g. an image job or a plain
+# `import steganography` never loads the video libraries. Run `python -m benchmark --imports-only` to check
+
+class SymbolReader:
+    """
+    Lazily collects carrier symbols from an iterator of arrays, pulling more chunks only when asked for them
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.symbols = np.zeros(0, dtype=np.uint8)
+
+    def __call__(self, count):
+        """
+        Return the first count symbols of the carrier (fewer if the carrier runs out)
+        """
+        parts = [self.symbols]
+        available = len(self.symbols)
+        while available < count:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            available += len(chunk)
+        if len(parts) > 1:
+            self.symbols = np.concatenate(parts)
+        return self.symbols[:count]
+
+
+def embed_shared_frame(memory_name, frame_offset, frame_shape, symbols_offset, symbol_count, lsb):
+    """
+    Worker process side of FrameBatch.embed: attach to the shared block and embed one frame in place
+    """
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=memory.buf, offset=frame_offset)
+        symbols = np.ndarray((symbol_count,), dtype=np.uint8, buffer=memory.buf, offset=symbols_offset)
+        Steganography.embed_symbols(frame.reshape(-1, frame_shape[-1])[:, :3], symbols, lsb)
+        del frame, symbols
+    finally:
+        memory.close()
+
+
+class FrameBatch:
+    """
+    Frames and their payload symbols laid out back to back in one shared memory block, so a process pool
+    can embed every frame in place without pickling pixel data
+    """
+    def __init__(self, frame_shapes):
+        from multiprocessing import shared_memory
+        self.layout = []
+        offset = 0
+        for shape in frame_shapes:
+            self.layout.append((offset, tuple(shape)))
+            offset += math.prod(shape)
+        self.symbols_offset = offset
+        self.symbol_capacity = sum(shape[0] * shape[1] * min(shape[2], 3) for _, shape in self.layout)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, offset + self.symbol_capacity))
+        self.frames = [np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf, offset=frame_offset)
+                       for frame_offset, shape in self.layout]
+        # frames of one shape are also exposed as a single (frames, h, w, c) array
+        shapes = {shape for _, shape in self.layout}
+        self.stack = None
+        if len(shapes) == 1:
+            self.stack = np.ndarray((len(self.layout),) + shapes.pop(), dtype=np.uint8, buffer=self.memory.buf)
+
+    def embed(self, symbols, lsb, executor=None):
+        """
+        Embed the symbols across the frames in order, one task per frame carrying payload.
+        Without an executor the frames are embedded in this process
+        """
+        shared_symbols = np.ndarray((len(symbols),), dtype=np.uint8, buffer=self.memory.buf, offset=self.symbols_offset)
+        shared_symbols[:] = symbols
+        if executor is None and self.stack is not None:
+            # one shot across the flattened frames
+            Steganography.embed_symbols(self.stack.reshape(-1, self.stack.shape[-1])[:, :3], shared_symbols, lsb)
+            del shared_symbols
+            return
+        tasks = []
+        start = 0
+        for (frame_offset, shape), frame in zip(self.layout, self.frames):
+            count = min(shape[0] * shape[1] * min(shape[2], 3), len(symbols) - start)
+            if count <= 0:
+                break
+            if executor is None:
+                Steganography.embed_symbols(frame.reshape(-1, shape[-1])[:, :3], shared_symbols[start:start + count], lsb)
+            else:
+                tasks.append(executor.submit(embed_shared_frame, self.memory.name, frame_offset, shape,
+                                             self.symbols_offset + start, count, lsb))
+            start += count
+        del shared_symbols
+        for task in tasks:
+            task.result()
+
+    def close(self):
+        self.frames = self.stack = None
+        self.memory.close()
+        self.memory.unlink()
+
 
 class Steganography:
     
+    # Number of audio frames read and written at a time when streaming WAV files
+    AUDIO_BLOCK_FRAMES = 65536
+
+    # Whether encoded files are opened in the system viewer once written (turned off for headless use)
+    OPEN_OUTPUT = True
+
     @staticmethod
-    def encode(input_path, msg, lsb, output_dir):
+    def encode(input_path, msg, lsb, output_dir, workers=None, audio_mode='stream', gif_mode='rgb', progress=None, cancel=None):
         """
-        Use the LSB of the pixels to encode the message into something
+        Use the LSB of the pixels to encode the message into something. The media adapter is picked from the
+        first bytes of the file (see media.py), unsupported files are rejected before anything is read.
+        input_path may also be a seekable binary file if output_dir is None (see encode_memory).
+        progress is called with (items done, total items, bytes processed) as the job runs, and setting the
+        cancel token (a jobs.CancelToken) stops it at the next chunk or frame
         """
-        print(f"Input path: {input_path}")
-        print(f"Message: {msg}")
-        print(f"LSB: {lsb}")
-        print(f"Output directory: {output_dir}")
-        
-        if(input_path.endswith(('.png', '.jpg', '.jpeg', '.bmp'))):
-            print("Encoding message into image...")
-            return Steganography.encode_image(input_path, msg, lsb, output_dir)
-                        
-        elif(input_path.endswith(('.wav', '.mp3', '.ogg', '.flac', '.m4a', '.aac'))):
-            print("Encoding message into audio...")
-            return Steganography.encode_audio(input_path, msg, lsb, output_dir)
-        
-        elif(input_path.endswith(('.gif'))):
-            print("Encoding message into GIF...")
-            return Steganography.encode_gif(input_path, msg, lsb, output_dir)
-        
-        elif input_path.endswith(('.mp4', '.avi', '.mov', '.mkv')):
-            print("Encoding message into video...")
-            return Steganography.encode_steganography_video(input_path, msg, lsb, output_dir)
+        logger.info("Encoding into %s with %d LSBs, output directory %s", input_path, lsb, output_dir)
+        if hasattr(input_path, 'read') and output_dir is not None:
+            return {"status": False, "message": "Covers given as files are encoded in memory, output_dir must be None"}
+        try:
+            adapter = media.lookup(input_path, 'encode')
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": str(e)}
+        options = adapter.options(workers=workers, audio_mode=audio_mode, gif_mode=gif_mode)
+        return adapter.encode(input_path, msg, lsb, output_dir, progress, cancel, **options)
     
     
     @staticmethod
-    def decode(input_path, lsb):
+    def decode(input_path, lsb, progress=None, cancel=None, tk_layout=False):
         """
-        Use the LSB of the pixels to encode the message into something
+        Use the LSB of the pixels to encode the message into something.
+        input_path may also be a seekable binary file. progress and cancel work as for encode.
+        tk_layout also reads images the Tk tool wrote before it used this engine (see decode_image)
         """
-        print(f"Input path: {input_path}")
-        print(f"LSB: {lsb}")
-        
-        if(input_path.endswith(('.png', '.jpg', '.jpeg', '.bmp'))):
-            print("Decoding message from image...")
-            return Steganography.decode_image(input_path, lsb)
-                        
-        elif(input_path.endswith(('.wav', '.mp3', '.ogg', '.flac', '.m4a', '.aac'))):
-            print("Decoding message from audio...")
-            return Steganography.decode_audio(input_path, lsb)
-        
-        elif(input_path.endswith(('.gif'))):
-            print("Decoding message from GIF...")
-            return Steganography.decode_gif(input_path, lsb)
-        
-        elif input_path.endswith(('.mp4', '.avi', '.mov', '.mkv')):
-            print("Decoding message from video...")
-            return Steganography.decode_steganography_video(input_path, lsb)
+        logger.info("Decoding from %s with %d LSBs", input_path, lsb)
+        try:
+            adapter = media.lookup(input_path, 'decode')
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": str(e)}
+        return adapter.decode(input_path, lsb, progress, cancel, **adapter.options(tk_layout=tk_layout))
     
     
     @staticmethod
-    def encode_image(img_path, msg, lsb, output_dir):
-        """
-        Use the LSBs of the pixels to encode the message into the image
-        """
-        fileExt = img_path.split('.')[-1]     
-           
-        if fileExt.lower() == 'gif':
-            img = Image.open(img_path).convert("RGB")
-        else:   
-            img = Image.open(img_path)
-
-        width, height = img.size
-        stop_code = '\x00'
-        max_payload_char = math.floor((width * height * 3 * lsb) / 8) - len(stop_code)
-        print("Maximum number of payload characters for the current image: " + str(max_payload_char))
-        msg += stop_code # add a stopping null character, one char space should be reserved for stopping code
-        length = len(msg)
-        print(msg)
-        if length > max_payload_char:
-            print(f"text too long! (don't exceed {max_payload_char} characters)")
-            return {"status": False, "message": "text too long! (don't exceed " + str(max_payload_char) + " characters)"}
-        
-        total_image_bits = width * height * 3 * 8
-        print(f"Total amount of characters used up: {length}/{max_payload_char} ({length / max_payload_char * 100}%)")
-        print("Total amount of bits available in image: " + str(total_image_bits))
-        print("Total amount of bits to replace for payload: " + str(length * 8))
-        print(f"Estimated image distortion: {length * 8 / total_image_bits * 100}%")
-        
-        encoded = img.copy()
-        index = 0
+    def encode_memory(cover, msg, lsb, workers=None, gif_mode='rgb', progress=None, cancel=None):
+        """
+        Encode without touching the filesystem. cover is the cover file as bytes or a binary file, and the stego
+        file comes back as bytes in the result's "output" (with its type in "format"), or a NumPy array, which
+        is handled by encode_array. Nothing is written to disk and no viewer is opened
+        """
+        if isinstance(cover, np.ndarray):
+            return Steganography.encode_array(cover, msg, lsb, progress, cancel)
+        if not hasattr(cover, 'read'):
+            cover = io.BytesIO(cover)
+        elif not cover.seekable():
+            cover = io.BytesIO(cover.read())
+        return Steganography.encode(cover, msg, lsb, None, workers, 'stream', gif_mode, progress, cancel)
 
-        mask = 0xFF << lsb  # Create a mask to clear the least significant bits
+    @staticmethod
+    def decode_memory(stego, lsb, progress=None, cancel=None):
+        """
+        Decode from a stego file given as bytes or a binary file, or from a NumPy array (see decode_array)
+        """
+        if isinstance(stego, np.ndarray):
+            return Steganography.decode_array(stego, lsb, progress, cancel)
+        if not hasattr(stego, 'read'):
+            stego = io.BytesIO(stego)
+        elif not stego.seekable():
+            stego = io.BytesIO(stego.read())
+        return Steganography.decode(stego, lsb, progress, cancel)
 
-        binary_msg = ''.join([format(ord(i), '08b') for i in msg])  # Convert the message to binary
-        len_binary_msg = len(binary_msg)
+    @staticmethod
+    def array_carrier(array):
+        """
+        (carriers, channels) view of the elements of an array that carry symbols: the RGB channels of a
+        (height, width, channels) pixel array, like an image file, otherwise every element, like the samples of a WAV
+        """
+        if array.ndim == 3:
+            return array.reshape(-1, array.shape[-1])[:, :3]
+        return array.reshape(-1, 1)
 
-        for row in range(height):
-            for col in range(width):
-                r, g, b, a = img.getpixel((col, row))
-                
-                # clear LSBs 
-                r &= mask
-                g &= mask
-                b &= mask
-
-                # Add the bits of the message
-                if index < len_binary_msg:
-                    secretBits = binary_msg[index:index+lsb]
-                    # if message not divisible by lsb, last character bits misalign, need to pad 0s on the right to width of lsb
-                    if len(secretBits) < lsb:
-                        secretBits = secretBits.ljust(lsb, '0')
-                    secretBitsInt = int(secretBits, 2)
-                    r = r | secretBitsInt
-                    index += lsb
-                if index < len_binary_msg:
-                    secretBits = binary_msg[index:index+lsb]
-                    if len(secretBits) < lsb:
-                        secretBits = secretBits.ljust(lsb, '0')
-                    secretBitsInt = int(secretBits, 2)
-                    g = g | secretBitsInt
-                    index += lsb
-                if index < len_binary_msg:
-                    secretBits = binary_msg[index:index+lsb]
-                    if len(secretBits) < lsb:
-                        secretBits = secretBits.ljust(lsb, '0')
-                    secretBitsInt = int(secretBits, 2)
-                    b = b | secretBitsInt
-                    index += lsb
-                if index >= len_binary_msg:
-                    break
-                
-                encoded.putpixel((col, row), (r, g, b, a))
+    @staticmethod
+    def encode_array(cover, msg, lsb, progress=None, cancel=None):
+        """
+        Encode into a copy of an integer array, returned in the result's "output". Symbols go in the same order as
+        in the matching file, so e.g. an encoded pixel array saved as PNG decodes with decode_image.
+        Progress is reported in pixels, or elements for arrays that aren't pixels
+        """
+        if not np.issubdtype(cover.dtype, np.integer):
+            return {"status": False, "message": f"Cover array must hold integers, not {cover.dtype}"}
+        try:
+            with stage("bitify", media="array") as event:
+                payload, flags = Steganography.message_to_bytes(msg)
+                event["bytes"] = len(payload)
+                symbols = Steganography.bytes_to_symbols(container.pack(payload, lsb, flags), lsb)
+
+            stego = np.array(cover, order='C')
+            carrier = Steganography.array_carrier(stego)
+            with stage("capacity", media="array", bytes=len(payload), capacity=carrier.size * lsb // 8 - container.HEADER_SIZE):
+                too_long = len(symbols) > carrier.size
+            if too_long:
+                return {"status": False, "message": "payload too long! (don't exceed " + str(max(0, carrier.size * lsb // 8 - container.HEADER_SIZE)) + " bytes)"}
+
+            job = JobProgress(progress, cancel, math.ceil(len(symbols) / carrier.shape[1]))
+            with stage("embed", media="array", bytes=len(payload) + container.HEADER_SIZE):
+                Steganography.embed_bands(carrier, symbols, lsb, job)
+            return {"status": True, "message": "Message encoded successfully", "output": stego}
+        except Cancelled:
+            return cancelled_result()
+
+    @staticmethod
+    def decode_array(stego, lsb, progress=None, cancel=None):
+        """
+        Decode the message from an integer array encoded by encode_array (or loaded from a stego image or WAV).
+        Progress is reported as for encode_array
+        """
+        if not np.issubdtype(stego.dtype, np.integer):
+            return {"status": False, "message": f"Stego array must hold integers, not {stego.dtype}"}
+        try:
+            carrier = Steganography.array_carrier(stego)
+            job = JobProgress(progress, cancel, len(carrier))
+            bands = Steganography.symbol_bands(lambda top, bottom: carrier[top:bottom], len(carrier), max(1, 4096 // carrier.shape[1]), lsb, job)
+
+            with stage("extract", media="array") as event:
+                decoded_msg = Steganography.read_message(SymbolReader(bands), lsb, None)
+                event["bytes"] = 0 if decoded_msg is None else len(decoded_msg)
+            if decoded_msg is None:
+                return {"status": False, "message": "No hidden message found in the array"}
+            return {"status": True, "message": decoded_msg}
+        except Cancelled:
+            return cancelled_result()
+        except Exception as e:
+            return {"status": False, "message": str(e)}
+
+    @staticmethod
+    def capacity(input_path, lsb, gif_mode='rgb'):
+        """
+        Number of payload bytes that fit in the cover file with the given number of LSBs
+        """
+        try:
+            adapter = media.lookup(input_path, 'capacity')
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": str(e)}
+        try:
+            symbols = adapter.capacity(input_path, **adapter.options(gif_mode=gif_mode))
+        except (OSError, EOFError, ValueError, wave.Error) as e:
+            return {"status": False, "message": f"Error reading cover file: {str(e) or 'the file is truncated'}"}
+
+        capacity = max(0, symbols * lsb // 8 - container.HEADER_SIZE)
+        return {"status": True, "message": f"{capacity} bytes fit with {lsb} LSBs", "capacity": capacity}
+
+    @staticmethod
+    def image_capacity(img_path):
+        """
+        Number of carrier symbols in an image: one per colour channel
+        """
+        from PIL import Image
+        with Image.open(img_path) as img:
+            width, height = img.size
+        return width * height * 3
+
+    @staticmethod
+    def audio_capacity(audio_path):
+        """
+        Number of carrier symbols in a WAV file: one per sample
+        """
+        with wave.open(audio_path, 'rb') as song:
+            return song.getnframes() * song.getnchannels()
+
+    @staticmethod
+    def gif_capacity(gif_path, gif_mode='rgb'):
+        """
+        Number of carrier symbols in a GIF: one per colour channel of every frame, or one per opaque pixel
+        of every frame in palette mode
+        """
+        if gif_mode == 'palette':
+            header, frames = Steganography.gif_blocks(Steganography.read_cover(gif_path))
+            symbols = 0
+            for frame in frames:
+                indices, _, transparency = Steganography.gif_frame_indices(header, *frame)
+                symbols += indices.size if transparency is None else int(np.count_nonzero(indices != transparency))
+            return symbols
+        from PIL import Image
+        with Image.open(gif_path) as gif:
+            width, height = gif.size
+            return getattr(gif, 'n_frames', 1) * width * height * 3
+
+    @staticmethod
+    def video_capacity(video_path):
+        """
+        Number of carrier symbols in a video: one per colour channel of every frame
+        """
+        width, height, _, _ = Steganography.probe_video(video_path)
+        return Steganography.count_frames(video_path) * width * height * 3
+
+    @staticmethod
+    def open_output(output_path):
+        """
+        Show an encoded file in the system viewer, unless OPEN_OUTPUT is turned off
+        """
+        if not Steganography.OPEN_OUTPUT:
+            return
+        if os.name == 'nt':
+            os.startfile(output_path)
+        elif os.name == 'posix':
+            subprocess.run(['open', output_path])
+
+    @staticmethod
+    def encode_image(img_path, msg, lsb, output_dir, progress=None, cancel=None):
+        """
+        Use the LSBs of the pixels to encode the message into the image.
+        With output_dir None (img_path may then be a binary file) the stego image is returned as bytes.
+        Progress is reported in pixels
+        """
+        from PIL import Image
+        try:
+            with stage("load", media="image") as event:
+                img = Image.open(img_path)
+                cover_format = img.format
+                if cover_format == 'GIF':
+                    img = img.convert("RGB")
+                if img.mode not in ('RGB', 'RGBA'):
+                    img = img.convert('RGBA')
+                pixels = np.array(img)
+                event["bytes"] = pixels.nbytes
+
+            # one lsb-wide symbol per colour channel, filled R, G, B pixel by pixel (alpha is left alone)
+            with stage("bitify", media="image") as event:
+                payload, flags = Steganography.message_to_bytes(msg)
+                symbols = Steganography.bytes_to_symbols(container.pack(payload, lsb, flags), lsb)
+                event["bytes"] = len(payload)
+
+            width, height = img.size
+            length = len(payload)
+            with stage("capacity", media="image", bytes=length) as event:
+                max_payload_char = math.floor((width * height * 3 * lsb) / 8) - container.HEADER_SIZE
+                event["capacity"] = max_payload_char
+            logger.info("Maximum number of payload bytes for the current image: %d", max_payload_char)
+            if length > max_payload_char:
+                logger.info("payload too long! (don't exceed %d bytes)", max_payload_char)
+                return {"status": False, "message": "payload too long! (don't exceed " + str(max_payload_char) + " bytes)"}
+        
+            total_image_bits = width * height * 3 * 8
+            logger.info("Total amount of bytes used up: %d/%d (%s%%)", length, max_payload_char, length / max_payload_char * 100)
+            logger.info("Total amount of bits available in image: %d", total_image_bits)
+            logger.info("Total amount of bits to replace for payload: %d", (length + container.HEADER_SIZE) * 8)
+            logger.info("Estimated image distortion: %s%%", (length + container.HEADER_SIZE) * 8 / total_image_bits * 100)
+        
+            job = JobProgress(progress, cancel, math.ceil(len(symbols) / 3))
+            with stage("embed", media="image", bytes=length + container.HEADER_SIZE):
+                Steganography.embed_bands(pixels.reshape(-1, pixels.shape[-1])[:, :3], symbols, lsb, job)
+                encoded = Image.fromarray(pixels)
                 
-        if isinstance(encoded, Image.Image):
-            img_ext = img_path.split('.')
-            output_path = os.path.join(output_dir, 'stego_image.' + img_ext[-1])
-            encoded.save(output_path)
-            if os.name == 'nt':
-                os.startfile(output_path)
-            elif os.name == 'posix':
-                subprocess.run(['open', output_path])
-            return {"status": True, "message": "Message encoded successfully"}
-        else:
-            return {"status": False, "message": "Error encoding message into image"}
+            if isinstance(encoded, Image.Image):
+                job.check()
+                # The stego image keeps the format of the cover as sniffed from its contents, whatever its
+                # file name says. JPEG would throw the LSBs away again, so lossy covers are written out as PNG
+                image_format = 'PNG' if cover_format == 'JPEG' else cover_format
+                if output_dir is None:
+                    with stage("save", media="image") as event:
+                        output = io.BytesIO()
+                        encoded.save(output, format=image_format)
+                        event["bytes"] = output.tell()
+                    return {"status": True, "message": "Message encoded successfully", "output": output.getvalue(), "format": image_format.lower()}
+                output_path = os.path.join(output_dir, 'stego_image.' + image_format.lower())
+                with stage("save", media="image") as event:
+                    encoded.save(output_path, format=image_format)
+                    event["bytes"] = os.path.getsize(output_path)
+                Steganography.open_output(output_path)
+                return {"status": True, "message": "Message encoded successfully", "output_path": output_path}
+            else:
+                return {"status": False, "message": "Error encoding message into image"}
+        except Cancelled:
+            return cancelled_result()
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": f"Error encoding image: {str(e)}"}
     
     
     @staticmethod
-    def decode_image(img_path, lsb):
+    def decode_image(img_path, lsb, progress=None, cancel=None, tk_layout=False):
         """
-        Use the LSB of the pixels to decode the message from the image
+        Use the LSB of the pixels to decode the message from the image.
+        Progress is reported in rows of pixels. With tk_layout, images without a container header are read the way
+        the Tk tool wrote them before it used this engine: across every channel of the pixel array, alpha included
         """
+        from PIL import Image
         try:
-            fileExt = img_path.split('.')[-1]
-            if fileExt.lower() == 'gif':
-                img = Image.open(img_path).convert("RGB")
-            else:
-                img = Image.open(img_path)
+            img = raw_img = Image.open(img_path)
+            if img.format == 'GIF':
+                img = img.convert("RGB")
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA')
             width, height = img.size
-            msg_bin = ""
-            
-            mask = Steganography.getMask(lsb)
-            
-            for row in range(height):
-                for col in range(width):
-                    r, g, b, a  = img.getpixel((col, row))
-                    
-                    # Extract the bits of the message
-                    r &= mask
-                    bin = format(r, 'b').rjust(lsb, '0')
-                    msg_bin += bin
-                    
-                    g &= mask
-                    bin = format(g, 'b').rjust(lsb,'0')
-                    msg_bin += bin
-                    
-                    b &= mask
-                    bin = format(b, 'b').rjust(lsb,'0')
-                    msg_bin += bin
-
-            # Convert the binary message to a string
-            decoded_msg = ''
-            for i in range(0, len(msg_bin), 8):
-                byte = msg_bin[i:i+8]
-                if len(byte) == 8:
-                    if int(byte, 2) == 0: # break if we hit a null character (stop code)
-                        break
-                    char = chr(int(byte, 2))
-                    decoded_msg += char
+            job = JobProgress(progress, cancel, height)
+
+            def read_rows(top, bottom):
+                pixels = np.asarray(img.crop((0, top, width, bottom)))
+                return pixels.reshape(-1, pixels.shape[-1])[:, :3]
+
+            def read_tk_rows(top, bottom):
+                return np.asarray(raw_img.crop((0, top, width, bottom))).reshape(-1, 1)
+
+            with stage("extract", media="image") as event:
+                bands = Steganography.symbol_bands(read_rows, height, max(1, math.ceil(4096 / width)), lsb, job)
+                decoded_msg = Steganography.read_message(SymbolReader(bands), lsb, None if tk_layout else b'\x00')
+                if decoded_msg is None:
+                    bands = Steganography.symbol_bands(read_tk_rows, height, max(1, math.ceil(4096 / width)), lsb, job)
+                    decoded_msg = Steganography.read_message(SymbolReader(bands), lsb, b'\x00')
+                event["bytes"] = len(decoded_msg)
 
             return {"status": True, "message": decoded_msg}
+        except Cancelled:
+            return cancelled_result()
         except Exception as e:
             return {"status": False, "message": str(e)}
     
     @staticmethod
-    def encode_audio(audio_path, msg, lsb, output_dir):
+    def encode_audio(audio_path, msg, lsb, output_dir, mode='stream', progress=None, cancel=None):
         """
-        Use the LSB of the audio samples to encode the message into the audio file
+        Use the LSB of the audio samples to encode the message into the audio file.
+        mode 'stream' rewrites the file block by block, 'mmap' copies the file and memory-maps the copy,
+        'in-place' memory-maps the cover itself and overwrites it. Progress is reported in audio frames.
+        With output_dir None (stream mode only, audio_path may then be a binary file) the encoded WAV is returned as bytes
         """
-        # Get the file extension
-        fileExt = audio_path.split('.')[-1]
+        if mode in ('mmap', 'in-place'):
+            # both memory-map a WAV file on disk
+            if output_dir is None or hasattr(audio_path, 'read'):
+                return {"status": False, "message": f"Audio mode '{mode}' needs a cover file and an output directory, use 'stream' in memory"}
+            return Steganography.encode_audio_mapped(audio_path, msg, lsb, output_dir, mode == 'in-place', progress, cancel)
         
         # read wave audio file
-        song = wave.open(audio_path, mode='rb')
+        try:
+            song = wave.open(audio_path, mode='rb')
+        except EOFError:
+            return {"status": False, "message": "Error reading audio file: the file is truncated"}
+        except (OSError, wave.Error) as e:
+            return {"status": False, "message": f"Error reading audio file: {str(e)}"}
         
-        # add stop code char to signify end of secret msg
-        stop_char = '='
-        msg += stop_char
+        # prefix the secret msg with the container header
+        with stage("bitify", media="audio") as event:
+            payload, flags = Steganography.message_to_bytes(msg)
+            event["bytes"] = len(payload)
+            payload = container.pack(payload, lsb, flags)
+            symbols = Steganography.bytes_to_symbols(payload, lsb)
         
-        # check if cover audio file is large enough for payload msg
-        if (len(msg) * 8) > song.getnframes():
+        # check if cover audio file is large enough for payload msg (lsb bits per sample)
+        sample_width = song.getsampwidth()
+        with stage("capacity", media="audio", bytes=len(payload)) as event:
+            event["capacity"] = song.getnframes() * song.getnchannels() * lsb // 8
+        if (len(payload) * 8) > song.getnframes() * song.getnchannels() * lsb:
+            song.close()
             return {"status": False, "message": "The message is too long for the audio file"}
         
-        # Read frames and convert to byte array
-        frame_bytes = bytearray(list(song.readframes(song.getnframes())))
-        
-        # convert secret msg into binary string
-        secretBits = ''.join([bin(ord(eachChar)).lstrip('0b').rjust(8,'0') for eachChar in msg])
-        lenOfSecretBits = len(secretBits)
-        
-        # Encode payload into cover frame
-        for i in range(0, lenOfSecretBits, lsb):
-            byte = frame_bytes[i//lsb]
-            for bit_index in range(lsb):
-                if (i + ((lsb-1)-bit_index)) < lenOfSecretBits:
-                    # to get the replacement bit from secret bits at the index corresponding with the bit_index 
-                    bit = int(secretBits[i + ((lsb-1)-bit_index)])
-                    # create the mask to clear the bit at the specified bit_index, depending on how many LSBs selected
-                    mask = ~(1 << bit_index)
-                    # AND the mask, to clear the bit at the specific index
-                    clearedByte = byte & mask
-                    # move the replacement bit to specific index position
-                    positionedReplacementBit = bit << bit_index
-                    # OR the positioned replacement bit, to set the bit at the specified index of frame byte with the replacement bit
-                    byte = clearedByte | positionedReplacementBit
-            frame_bytes[i//lsb] = byte
-        
-        # Get the modified bytes
-        frame_modified = bytes(frame_bytes)
-        output_path = os.path.join(output_dir, 'encoded_audio.' + fileExt)
-        # Write bytes to a new wave audio file
-        with wave.open(output_path, 'wb') as fd:
-            fd.setparams(song.getparams())
-            fd.writeframes(frame_modified)
+        # Stream the frames through in fixed-size blocks so memory use stays constant; only the blocks
+        # carrying payload are modified, the rest is copied straight across
+        clear_mask = ~Steganography.getMask(lsb) & 0xFF
+        symbol_counter = 0
+        timer = StageTimer("load", "embed", "save")
+        streamed_bytes = 0
+        job = JobProgress(progress, cancel, song.getnframes())
+        if output_dir is None:
+            output = io.BytesIO()
+        else:
+            output = output_path = os.path.join(output_dir, 'encoded_audio.wav')
+        try:
+            with wave.open(output, 'wb') as fd:
+                fd.setparams(song.getparams())
+                while True:
+                    job.check()
+                    with timer("load"):
+                        frame_bytes = song.readframes(Steganography.AUDIO_BLOCK_FRAMES)
+                    if not frame_bytes:
+                        break
+                    with timer("embed"):
+                        if symbol_counter < len(symbols):
+                            frame_bytes = bytearray(frame_bytes)
+                            samples = Steganography.sample_lsb_view(frame_bytes, sample_width)
+                            block_symbols = symbols[symbol_counter:symbol_counter + samples.size]
+                            carrier = samples[:len(block_symbols)]
+                            carrier &= clear_mask
+                            carrier |= block_symbols
+                            symbol_counter += len(block_symbols)
+                    with timer("save"):
+                        fd.writeframes(frame_bytes)
+                    streamed_bytes += len(frame_bytes)
+                    job.update(fd.getnframes(), streamed_bytes)
+        except (Cancelled, OSError, EOFError, wave.Error) as e:
+            # don't leave a half-written file behind
+            song.close()
+            if output_dir is not None and os.path.exists(output_path):
+                os.remove(output_path)
+            if isinstance(e, Cancelled):
+                return cancelled_result()
+            return {"status": False, "message": f"Error encoding audio: {str(e)}"}
         song.close()
+        timer.emit(media="audio", bytes=streamed_bytes)
+        if output_dir is None:
+            return {"status": True, "message": "Audio encoded successfully", "output": output.getvalue(), "format": "wav"}
         
         # Handle the case where the output file is not created
         try:
             with wave.open(output_path, 'rb') as fd:
-                os.startfile(output_path)
-                return {"status": True, "message": "Audio encoded successfully"}
+                Steganography.open_output(output_path)
+                return {"status": True, "message": "Audio encoded successfully", "output_path": output_path}
         except FileNotFoundError:
             return {"status": False, "message": "Error creating encoded audio file"}
         except wave.Error:
@@ -261,292 +524,1034 @@ class Steganography:
         
         
     @staticmethod
-    def decode_audio(audio_path, lsb):
+    def encode_audio_mapped(audio_path, msg, lsb, output_dir, in_place=False, progress=None, cancel=None):
         """
-        Decode the hidden message from an audio file
+        Encode into an uncompressed WAV by memory-mapping its data chunk and rewriting only the samples
+        carrying the payload. Unless in_place is set, the cover is first copied with the OS's fast copy path.
+        Progress is reported in samples; the samples are rewritten in one go, so cancelling never leaves
+        a half-encoded cover behind
         """
+        output_path = None
         try:
-            song = wave.open(audio_path, mode='rb')
-            # Convert audio to byte array
-            frame_bytes = bytearray(list(song.readframes(song.getnframes())))
+            data_offset, data_size, sample_width, _ = Steganography.parse_wav_header(audio_path)
             
-            # Extract payload from stego audio
-            payload_bin = ''
+            with stage("bitify", media="audio") as event:
+                payload, flags = Steganography.message_to_bytes(msg)
+                event["bytes"] = len(payload)
+                payload = container.pack(payload, lsb, flags)
+                symbols = Steganography.bytes_to_symbols(payload, lsb)
+            with stage("capacity", media="audio", bytes=len(payload), capacity=(data_size // sample_width) * lsb // 8):
+                too_long = (len(payload) * 8) > (data_size // sample_width) * lsb
+            if too_long:
+                return {"status": False, "message": "The message is too long for the audio file"}
+            
+            job = JobProgress(progress, cancel, len(symbols))
+            job.check()
+            if in_place:
+                output_path = audio_path
+            else:
+                output_path = os.path.join(output_dir, 'encoded_audio.wav')
+                with stage("save", media="audio", bytes=os.path.getsize(audio_path)):
+                    Steganography.copy_file(audio_path, output_path)
+                job.check()
+            
+            with stage("embed", media="audio", bytes=len(payload)):
+                data = np.memmap(output_path, dtype=np.uint8, mode='r+', offset=data_offset, shape=(data_size - data_size % sample_width,))
+                carrier = Steganography.sample_lsb_view(data, sample_width)[:len(symbols)]
+                carrier &= ~Steganography.getMask(lsb) & 0xFF
+                carrier |= symbols
+                data.flush()
+                del carrier, data
+            job.update(len(symbols), len(symbols) * sample_width)
+            return {"status": True, "message": f"Audio encoded successfully at {output_path}", "output_path": output_path}
+        except Cancelled:
+            # remove the copy (the cover itself is only touched once nothing can cancel any more)
+            if output_path is not None and not in_place and os.path.exists(output_path):
+                os.remove(output_path)
+            return cancelled_result()
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": f"Error encoding audio: {str(e)}"}
+
+    @staticmethod
+    def parse_wav_header(audio_path):
+        """
+        Walk the RIFF chunks of a PCM WAV file, returns (data offset, data size, sample width, channels)
+        """
+        with open(audio_path, 'rb') as file:
+            riff, _, wave_id = struct.unpack('<4sI4s', file.read(12))
+            if riff != b'RIFF' or wave_id != b'WAVE':
+                raise ValueError("Not a RIFF/WAVE file")
+            sample_width = channels = None
+            while True:
+                chunk_header = file.read(8)
+                if len(chunk_header) < 8:
+                    raise ValueError("WAV file has no data chunk")
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+                if chunk_id == b'fmt ':
+                    format_tag, channels, _, _, block_align, _ = struct.unpack('<HHIIHH', file.read(16))
+                    if format_tag not in (1, 0xFFFE): # PCM, WAVE_FORMAT_EXTENSIBLE
+                        raise ValueError(f"Unsupported WAV format tag: {format_tag}")
+                    sample_width = block_align // channels
+                    file.seek(chunk_size - 16 + chunk_size % 2, os.SEEK_CUR)
+                elif chunk_id == b'data':
+                    if sample_width is None:
+                        raise ValueError("WAV data chunk comes before its fmt chunk")
+                    data_size = min(chunk_size, os.fstat(file.fileno()).st_size - file.tell())
+                    return file.tell(), data_size, sample_width, channels
+                else:
+                    file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR) # chunks are padded to an even size
+
+    @staticmethod
+    def read_cover(cover):
+        """
+        All the bytes of a file given as a path or a seekable binary file (whose position is left where it was)
+        """
+        if hasattr(cover, 'read'):
+            position = cover.tell()
+            cover.seek(0)
+            data = cover.read()
+            cover.seek(position)
+            return data
+        with open(cover, 'rb') as file:
+            return file.read()
+
+    @staticmethod
+    def copy_file(source_path, destination_path):
+        """
+        Copy a file using copy_file_range where available, shutil.copyfile (sendfile / fcopyfile) otherwise
+        """
+        if hasattr(os, 'copy_file_range'):
+            with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+                try:
+                    remaining = os.fstat(source.fileno()).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(source.fileno(), destination.fileno(), remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                    if remaining == 0:
+                        return
+                except OSError:
+                    pass # e.g. copying across filesystems on older kernels
+        shutil.copyfile(source_path, destination_path)
+
+    @staticmethod
+    def decode_audio(audio_path, lsb, progress=None, cancel=None):
+        """
+        Decode the hidden message from an audio file. Progress is reported in audio frames
+        """
+        try:
+            song = wave.open(audio_path, mode='rb')
             mask = Steganography.getMask(lsb)
-            for i in range(0, len(frame_bytes), lsb):
-                byte = frame_bytes[i//lsb]
-                byte = byte & mask
-                bin = format(byte, 'b').rjust(lsb, '0')
-                payload_bin += bin
+            job = JobProgress(progress, cancel, song.getnframes())
             
-            # Convert binary payload to text
-            payload = ''
-            for i in range(0, len(payload_bin), 8):
-                byte = payload_bin[i:i+8]
-                if len(byte) == 8:
-                    char = chr(int(byte, 2))
-                    if char.__eq__("="): # stop code reached
-                        break
+            def frame_blocks(per_sample):
+                # Read the frames in blocks (growing up to AUDIO_BLOCK_FRAMES), only as far as the payload reaches
+                block = 4096
+                while True:
+                    job.check()
+                    frame_bytes = song.readframes(block)
+                    if not frame_bytes:
+                        return
+                    job.update(song.tell(), song.tell() * song.getsampwidth() * song.getnchannels())
+                    if per_sample:
+                        yield Steganography.sample_lsb_view(frame_bytes, song.getsampwidth()) & mask
                     else:
-                        payload += char
+                        yield np.frombuffer(frame_bytes, dtype=np.uint8) & mask
+                    block = min(block * 2, Steganography.AUDIO_BLOCK_FRAMES)
+            
+            # Extract payload from the LSBs of the samples
+            with stage("extract", media="audio") as event:
+                payload = Steganography.read_message(SymbolReader(frame_blocks(True)), lsb, None)
+                if payload is None:
+                    # older files spread the payload over every byte of the frames
+                    # ('=' was the stop code before the container header)
+                    song.rewind()
+                    payload = Steganography.read_message(SymbolReader(frame_blocks(False)), lsb, b'=')
+                event["bytes"] = len(payload)
             
             song.close()
             return {"status": True, "message": payload}
+        except Cancelled:
+            song.close()
+            return cancelled_result()
         except Exception as e:
             return {"status": False, "message": str(e)}
         
 
     @staticmethod
-    def encode_gif(gif_path, msg, lsb, output_dir):
-        # Open the GIF and convert each frame to RGB
-        gif = Image.open(gif_path)
+    def encode_gif(gif_path, msg, lsb, output_dir, workers=None, mode='rgb', progress=None, cancel=None):
+        """
+        Use the LSBs of the GIF frames to encode the message. mode 'rgb' embeds in the RGB channels of the frames,
+        'palette' embeds in the palette indices of the frames without any colour conversion.
+        With output_dir None (gif_path may then be a binary file) the stego GIF is returned as bytes.
+        Progress is reported in frames
+        """
+        if mode == 'palette':
+            return Steganography.encode_gif_palette(gif_path, msg, lsb, output_dir, progress, cancel)
 
-        frames = []
-        for frame in ImageSequence.Iterator(gif):
-            if frame.mode == 'P':
-                frames.append(frame.convert('RGB'))
-            else:
-                frames.append(frame.convert('RGBA'))
-
-        # Calculate the total number of bits available in the GIF
-        total_bits = sum(frame.width * frame.height * 3 for frame in frames)
-
-        # Add a stop code to the message and convert it to binary
-        stop_code = '\x00'
-        msg += stop_code
-        binary_msg = ''.join(format(ord(i), '08b') for i in msg)
-
-        # Check if the message is too long to fit in the GIF
-        if len(binary_msg) > total_bits * lsb:
-            return {"status": False, "message": "Message too long to fit in GIF"}
-
-        # Encode the message into each frame
-        index = 0
-        mask = (1 << lsb) - 1
-        clear_mask = ~mask & 0xFF
-
-        for frame in frames:
-            for row in range(frame.height):
-                for col in range(frame.width):
-                    pixel = list(frame.getpixel((col, row)))
-
-                    for i in range(3):  # RGB channels
-                        if index < len(binary_msg):
-                            pixel[i] &= clear_mask  # Clear the LSBs
-                            pixel[i] |= int(binary_msg[index:index+lsb].ljust(lsb, '0'), 2)
-                            index += lsb
-
-                    if frame.mode == 'RGBA':
-                        frame.putpixel((col, row), tuple(pixel))
-                    else:
-                        frame.putpixel((col, row), (pixel[0], pixel[1], pixel[2]))
+        from PIL import Image, ImageSequence
+        try:
+            gif = Image.open(gif_path)
+        except OSError as e:
+            return {"status": False, "message": f"Error encoding GIF: {str(e)}"}
+        try:
+            width, height = gif.size
+            frame_count = getattr(gif, 'n_frames', 1)
+
+            # Prefix the message with the container header and split it into lsb-wide symbols
+            with stage("bitify", media="gif") as event:
+                payload, flags = Steganography.message_to_bytes(msg)
+                event["bytes"] = len(payload)
+                payload = container.pack(payload, lsb, flags)
+                symbols = Steganography.bytes_to_symbols(payload, lsb)
+
+            # Check if the message is too long to fit in the GIF
+            with stage("capacity", media="gif", bytes=len(payload), capacity=frame_count * width * height * 3 * lsb // 8):
+                too_long = len(symbols) > frame_count * width * height * 3
+            if too_long:
+                return {"status": False, "message": "Message too long to fit in GIF"}
+
+            # Only the frames carrying payload are converted (palette frames to RGB as before, RGBA if Pillow
+            # already hands any of them out as RGBA), keeping their duration and disposal
+            payload_frames = math.ceil(len(symbols) / (width * height * 3))
+            job = JobProgress(progress, cancel, payload_frames)
+            with stage("load", media="gif", frames=payload_frames):
+                frames, durations, disposals = [], [], []
+                for frame in ImageSequence.Iterator(gif):
+                    if len(frames) == payload_frames:
+                        break
+                    job.check()
+                    frames.append(frame.copy())
+                    durations.append(frame.info.get('duration', 0))
+                    disposals.append(getattr(gif, 'disposal_method', 0))
+                mode = 'RGBA' if any(frame.mode == 'RGBA' for frame in frames) else 'RGB'
+
+            # Stack them into one (frames, h, w, c) array and embed across it, spreading frames over a process pool
+            batch = FrameBatch([(height, width, len(mode))] * payload_frames)
+            executor = Steganography.process_pool(Steganography.worker_count(workers, payload_frames))
+            try:
+                with stage("embed", media="gif", frames=payload_frames, bytes=len(payload)):
+                    for index, (shared_frame, frame) in enumerate(zip(batch.frames, frames)):
+                        job.check()
+                        shared_frame[:] = np.asarray(frame.convert(mode))
+                        job.update(index, index * shared_frame.nbytes)
+                    batch.embed(symbols, lsb, executor)
+                    frames = [Image.fromarray(shared_frame.copy()) for shared_frame in batch.frames]
+                    job.update(payload_frames, sum(shared_frame.nbytes for shared_frame in batch.frames))
+            finally:
+                # the shared memory block is released whether or not the job finished
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+                batch.close()
+
+            # Save the encoded frames, then append the untouched frames as they are in the cover file
+            with stage("serialize", media="gif", frames=frame_count) as event:
+                if len(frames) == 1: # Pillow only takes per-frame lists when writing several frames
+                    durations, disposals = durations[0], disposals[0]
+                save_options = {"duration": durations, "disposal": disposals}
+                if 'loop' in gif.info:
+                    save_options["loop"] = gif.info['loop']
+                encoded = io.BytesIO()
+                frames[0].save(encoded, format='GIF', save_all=True, append_images=frames[1:], **save_options)
+                encoded = encoded.getvalue()
+                if payload_frames < frame_count:
+                    remaining_frames = Steganography.split_gif_frames(Steganography.read_cover(gif_path))[payload_frames:]
+                    encoded = encoded[:-1] + b''.join(remaining_frames) + b';' # drop and re-add the trailer
+                event["bytes"] = len(encoded)
+
+            # Pillow re-quantises any frame left with more than 256 colours by the embedding, which destroys the
+            # payload, so read it back from the encoded GIF before reporting success
+            with stage("verify", media="gif", bytes=len(payload)):
+                mask = Steganography.getMask(lsb)
+                with Image.open(io.BytesIO(encoded)) as written:
+                    channels = (Steganography.gif_frame_rgb(frame).reshape(-1) & mask for frame in ImageSequence.Iterator(written))
+                    try:
+                        intact = Steganography.read_message(SymbolReader(channels), lsb, None) is not None
+                    except ValueError:
+                        intact = False
+            if not intact:
+                return {"status": False, "message": "The encoded frames have more than 256 colours, so the GIF can't keep "
+                                                    "the payload with these LSBs; use gif_mode='palette' instead"}
 
-        # Save the encoded GIF
+            job.check()
+            if output_dir is None:
+                return {"status": True, "message": "Message encoded successfully", "output": encoded, "format": "gif"}
+            output_path = os.path.join(output_dir, 'stego_gif.gif')
+            with stage("save", media="gif", bytes=len(encoded)):
+                with open(output_path, 'wb') as file:
+                    file.write(encoded)
+
+            # Open the encoded GIF
+            Steganography.open_output(output_path)
+
+            return {"status": True, "message": "Message encoded successfully", "output_path": output_path}
+        except Cancelled:
+            return cancelled_result()
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": f"Error encoding GIF: {str(e)}"}
+        finally:
+            gif.close()
+
+    @staticmethod
+    def encode_gif_palette(gif_path, msg, lsb, output_dir, progress=None, cancel=None):
+        """
+        Encode straight into the palette indices of the GIF frames, one symbol per opaque pixel.
+        Every frame carrying payload gets a local colour table of the colours it uses sorted by luminance,
+        so changing the LSBs of an index moves the pixel to a colour of similar brightness.
+        The remaining frames are copied unchanged. Progress is reported in frames
+        """
+        try:
+            with stage("bitify", media="gif") as event:
+                payload, flags = Steganography.message_to_bytes(msg)
+                event["bytes"] = len(payload)
+                payload = container.pack(payload, lsb, flags)
+                symbols = Steganography.bytes_to_symbols(payload, lsb)
+
+            timer = StageTimer("load", "embed", "serialize")
+            with timer("load"):
+                header, frames = Steganography.gif_blocks(Steganography.read_cover(gif_path))
+
+            group = 1 << lsb
+            luminance = np.array([299, 587, 114])
+            encoded = [header]
+            symbol_counter = 0
+            payload_frames = 0
+            job = JobProgress(progress, cancel, len(frames))
+            processed_bytes = 0
+            for frame_index, (extensions, descriptor, table, image_data) in enumerate(frames):
+                job.update(frame_index, processed_bytes)
+                processed_bytes += len(extensions) + len(descriptor) + len(table) + len(image_data)
+                if symbol_counter == len(symbols):
+                    encoded.append(extensions + descriptor + table + image_data)
+                    continue
+                with timer("load"):
+                    indices, palette, transparency = Steganography.gif_frame_indices(header, extensions, descriptor, table, image_data)
+                with timer("embed"):
+                    opaque = indices != transparency if transparency is not None else np.ones(indices.shape, dtype=bool)
+                    used = np.unique(indices[opaque])
+                    if len(used) == 0:
+                        encoded.append(extensions + descriptor + table + image_data)
+                        continue
+
+                    # Sort the used colours by luminance and pad them to a whole number of lsb groups (so embedding
+                    # never leaves the opaque colours), the transparent colour gets the index after them
+                    order = used[np.argsort(palette[used] @ luminance, kind='stable')]
+                    slots = -(-len(order) // group) * group
+                    transparent = transparency is not None and not opaque.all()
+                    if slots + transparent > 256:
+                        raise ValueError(f"A frame uses too many colours to embed in its palette indices with {lsb} LSBs")
+                    colours = np.concatenate((palette[order], np.repeat(palette[order[-1:]], slots - len(order), axis=0)))
+                    lookup = np.zeros(256, dtype=np.uint8)
+                    lookup[order] = np.arange(len(order))
+                    if transparent:
+                        lookup[transparency] = slots
+                        colours = np.concatenate((colours, palette[transparency:transparency + 1]))
+
+                    # Remap the index plane to the sorted palette and embed into its opaque pixels
+                    indices = lookup[indices]
+                    carrier = indices[opaque]
+                    frame_symbols = symbols[symbol_counter:symbol_counter + carrier.size]
+                    Steganography.embed_symbols(carrier.reshape(-1, 1), frame_symbols, lsb)
+                    indices[opaque] = carrier
+                    symbol_counter += len(frame_symbols)
+                    payload_frames += 1
+
+                with timer("serialize"):
+                    encoded.append(Steganography.gif_palette_frame(extensions, descriptor, indices, colours, slots if transparent else None))
+
+            timer.emit(media="gif", frames=payload_frames, bytes=len(payload))
+            if symbol_counter < len(symbols):
+                return {"status": False, "message": "Message too long to fit in GIF"}
+            encoded.append(b';')
+            job.update(len(frames), processed_bytes)
+        except Cancelled:
+            return cancelled_result()
+        except (OSError, ValueError) as e:
+            return {"status": False, "message": f"Error encoding GIF: {str(e)}"}
+
+        encoded = b''.join(encoded)
+        if output_dir is None:
+            return {"status": True, "message": "Message encoded successfully", "output": encoded, "format": "gif"}
         output_path = os.path.join(output_dir, 'stego_gif.gif')
-        frames[0].save(output_path, save_all=True, append_images=frames[1:])
+        with stage("save", media="gif", bytes=len(encoded)):
+            with open(output_path, 'wb') as file:
+                file.write(encoded)
 
         # Open the encoded GIF
-        if os.name == 'nt':
-            os.startfile(output_path)
-        elif os.name == 'posix':
-            subprocess.run(['open', output_path])
+        Steganography.open_output(output_path)
 
-        return {"status": True, "message": "Message encoded successfully"}
+        return {"status": True, "message": "Message encoded successfully", "output_path": output_path}
 
     @staticmethod
-    def decode_gif(gif_path, lsb):
+    def decode_gif(gif_path, lsb, progress=None, cancel=None):
+        """
+        Decode the hidden message from a GIF, encoded in either mode. Progress is reported in frames
+        """
         try:
-            gif = Image.open(gif_path)
-            msg_bin = ""
-            
             mask = (1 << lsb) - 1
 
-            # Iterate over each frame in the GIF
-            for frame in ImageSequence.Iterator(gif):
-                width, height = frame.size
-                
-                for row in range(height):
-                    for col in range(width):
-                        pixel = frame.getpixel((col, row))
-
-                        if frame.mode == 'P':
-                            palette = frame.getpalette()
-                            r, g, b = palette[pixel*3:pixel*3+3]
-                        elif isinstance(pixel, int):
-                            r = g = b = pixel
-                            a = 255
-                        else:
-                            if frame.mode == 'RGBA':
-                                r, g, b, a = pixel
-                            else:
-                                r, g, b = pixel
-                        
-                        # Extract the bits of the message
-                        msg_bin += format(r & mask, f'0{lsb}b')
-                        msg_bin += format(g & mask, f'0{lsb}b')
-                        msg_bin += format(b & mask, f'0{lsb}b')
-
-                        # Check if we've found the stop code
-                        if len(msg_bin) >= 8 and msg_bin[-8:] == format(ord('\x00'), '08b'):
-                            break
-                    if len(msg_bin) >= 8 and msg_bin[-8:] == format(ord('\x00'), '08b'):
-                        break
-                if len(msg_bin) >= 8 and msg_bin[-8:] == format(ord('\x00'), '08b'):
-                    break
-
-            # Convert the binary message to a string
-            decoded_msg = ''
-            for i in range(0, len(msg_bin), 8):
-                byte = msg_bin[i:i+8]
-                if len(byte) == 8:
-                    char = chr(int(byte, 2))
-                    if char == '\x00':
-                        break
-                    decoded_msg += char
+            # GIFs encoded in palette mode carry the container header in the palette indices
+            header, frames = Steganography.gif_blocks(Steganography.read_cover(gif_path))
+            job = JobProgress(progress, cancel, len(frames))
+
+            def frame_indices():
+                processed_bytes = 0
+                for frame_index, frame in enumerate(frames):
+                    job.check()
+                    indices, _, transparency = Steganography.gif_frame_indices(header, *frame)
+                    processed_bytes += indices.nbytes
+                    job.update(frame_index + 1, processed_bytes)
+                    indices = indices.reshape(-1)
+                    if transparency is not None:
+                        indices = indices[indices != transparency]
+                    yield indices & mask
+
+            with stage("extract", media="gif") as event:
+                decoded_msg = Steganography.read_message(SymbolReader(frame_indices()), lsb, None)
+                event["bytes"] = 0 if decoded_msg is None else len(decoded_msg)
+            if decoded_msg is not None:
+                return {"status": True, "message": decoded_msg}
+
+            from PIL import Image, ImageSequence
+            gif = Image.open(gif_path)
+
+            def frame_channels():
+                # Hand out the RGB channels frame by frame, so frames past the payload are never read
+                processed_bytes = 0
+                for frame_index, frame in enumerate(ImageSequence.Iterator(gif)):
+                    job.check()
+                    channels = Steganography.gif_frame_rgb(frame)
+                    processed_bytes += channels.nbytes
+                    job.update(frame_index + 1, processed_bytes)
+                    yield channels.reshape(-1) & mask
+
+            try:
+                with stage("extract", media="gif") as event:
+                    decoded_msg = Steganography.read_message(SymbolReader(frame_channels()), lsb, b'\x00')
+                    event["bytes"] = len(decoded_msg)
+            finally:
+                gif.close()
 
             return {"status": True, "message": decoded_msg}
+        except Cancelled:
+            return cancelled_result()
         except Exception as e:
             return {"status": False, "message": str(e)}
 
         
+    @staticmethod
+    def gif_blocks(data):
+        """
+        Walk the blocks of a GIF file. Returns (header, frames), where header is everything before the first block
+        (signature, logical screen descriptor and global colour table) and every frame is a tuple of its raw
+        (extension blocks, image descriptor, local colour table, image data) bytes
+        """
+        if data[:6] not in (b'GIF87a', b'GIF89a'):
+            raise ValueError("Not a GIF file")
+        if len(data) < 13:
+            raise ValueError("GIF file is truncated")
+        position = 13
+        packed = data[10]
+        if packed & 0x80:
+            position += 3 * (2 << (packed & 0x07))
+        if len(data) <= position:
+            raise ValueError("GIF file is truncated")
+        header = data[:position]
+
+        def skip_sub_blocks(position):
+            while position < len(data) and data[position]:
+                position += data[position] + 1
+            if position >= len(data):
+                raise ValueError("GIF file is truncated")
+            return position + 1
+
+        frames = []
+        frame_start = position
+        while position < len(data) and data[position] != 0x3B: # trailer
+            if data[position] == 0x21: # extension: label, then sub-blocks
+                position = skip_sub_blocks(position + 2)
+            elif data[position] == 0x2C: # image descriptor
+                extensions = data[frame_start:position]
+                descriptor = data[position:position + 10]
+                if len(descriptor) < 10:
+                    raise ValueError("GIF file is truncated")
+                position += 10
+                table = b''
+                if descriptor[9] & 0x80:
+                    table = data[position:position + 3 * (2 << (descriptor[9] & 0x07))]
+                    position += len(table)
+                image_start = position
+                position = skip_sub_blocks(position + 1) # LZW minimum code size, then sub-blocks
+                frames.append((extensions, descriptor, table, data[image_start:position]))
+                frame_start = position
+            else:
+                raise ValueError(f"Unexpected GIF block 0x{data[position]:02x}")
+        return header, frames
+
+    @staticmethod
+    def split_gif_frames(data):
+        """
+        Split a GIF file into the raw bytes of each frame (its extension blocks plus image block).
+        Frames using the global colour table get it as a local colour table, so they can be appended
+        to another GIF stream unchanged
+        """
+        header, frames = Steganography.gif_blocks(data)
+        global_table = header[13:]
+        split = []
+        for extensions, descriptor, table, image_data in frames:
+            if not table and global_table:
+                # keep the interlace flag, flag a local table the size of the global one
+                table = global_table
+                descriptor = descriptor[:9] + bytes([(descriptor[9] & 0x40) | 0x80 | (header[10] & 0x07)])
+            split.append(extensions + descriptor + table + image_data)
+        return split
+
+    @staticmethod
+    def gif_control_block(extensions):
+        """
+        Offset of the graphic control extension among a frame's extension blocks, or None if it has none
+        """
+        position = 0
+        while position < len(extensions):
+            if extensions[position + 1] == 0xF9:
+                return position
+            position += 2
+            while extensions[position]:
+                position += extensions[position] + 1
+            position += 1
+        return None
+
+    @staticmethod
+    def gif_frame_indices(header, extensions, descriptor, table, image_data):
+        """
+        Decode the raw blocks of one GIF frame into (palette index plane, (n, 3) palette, transparent index or None),
+        without compositing it onto the previous frames or converting it to RGB
+        """
+        if not table:
+            table = header[13:]
+        if not table:
+            raise ValueError("GIF frame has no colour table")
+        control = Steganography.gif_control_block(extensions)
+        transparency = None
+        if control is not None and extensions[control + 3] & 0x01:
+            transparency = extensions[control + 6]
+
+        # Wrap the frame in a GIF of its own size with its colour table as the global one, so Pillow
+        # loads it as a single palette image
+        table_bits = descriptor[9] & 0x07 if descriptor[9] & 0x80 else header[10] & 0x07
+        screen = descriptor[5:9] + bytes([0x80 | table_bits, 0, 0])
+        standalone = b'GIF89a' + screen + table + b'\x2c\x00\x00\x00\x00' + descriptor[5:9] + bytes([descriptor[9] & 0x40]) + image_data + b';'
+        from PIL import Image
+        with Image.open(io.BytesIO(standalone)) as frame:
+            indices = np.array(frame)
+        return indices, np.frombuffer(table, dtype=np.uint8).reshape(-1, 3), transparency
+
+    @staticmethod
+    def gif_palette_frame(extensions, descriptor, indices, colours, transparency):
+        """
+        Build the raw blocks of a GIF frame from an index plane and its local colour table, keeping the
+        extension blocks and position of the original frame. transparency is the new transparent index (or None)
+        """
+        from PIL import Image
+        encoded = io.BytesIO()
+        frame = Image.fromarray(indices, 'P')
+        frame.putpalette(colours.astype(np.uint8).tobytes())
+        frame.save(encoded, format='GIF', optimize=False)
+        header, [(_, new_descriptor, _, image_data)] = Steganography.gif_blocks(encoded.getvalue())
+
+        control = Steganography.gif_control_block(extensions)
+        if control is not None and extensions[control + 3] & 0x01:
+            extensions = bytearray(extensions)
+            if transparency is None: # the transparent index no longer appears in the frame
+                extensions[control + 3] &= 0xFE
+            else:
+                extensions[control + 6] = transparency
+            extensions = bytes(extensions)
+        # The frame's table becomes a local one, with Pillow's interlacing
+        packed = (new_descriptor[9] & 0x40) | 0x80 | (header[10] & 0x07)
+        return extensions + descriptor[:9] + bytes([packed]) + header[13:] + image_data
+
+    @staticmethod
+    def gif_frame_rgb(frame):
+        """
+        RGB array of a GIF frame. Palette frames are expanded by indexing the palette as a lookup table
+        """
+        if frame.mode == 'P' and frame.getpalette() is not None:
+            palette = np.zeros((256, 3), dtype=np.uint8)
+            colours = np.asarray(frame.getpalette(), dtype=np.uint8).reshape(-1, 3)[:256]
+            palette[:len(colours)] = colours
+            return palette[np.asarray(frame)]
+        if frame.mode == 'L':
+            return np.repeat(np.asarray(frame)[..., None], 3, axis=2)
+        if frame.mode in ('RGB', 'RGBA'):
+            return np.asarray(frame)[..., :3]
+        return np.asarray(frame.convert('RGB'))
+
     @staticmethod
     def getMask(lsb):
         return (1 << lsb) - 1
+
+    @staticmethod
+    def read_message(reader, lsb, stop_code):
+        """
+        Recover the message from a SymbolReader. Only the container header is read first, then
+        exactly the payload length. Covers written before the header existed fall back to scanning for stop_code
+        (if stop_code is None, None is returned instead). Text payloads come back as str, binary payloads as bytes
+        """
+        header_symbols = math.ceil(container.HEADER_SIZE * 8 / lsb)
+        header = container.parse_header(Steganography.symbols_to_bytes(reader(header_symbols), lsb))
+        if header is not None:
+            total = container.HEADER_SIZE + header["length"]
+            data = Steganography.symbols_to_bytes(reader(math.ceil(total * 8 / lsb)), lsb)
+            payload = data[container.HEADER_SIZE:total]
+            container.verify(header, payload)
+            if header["flags"] & container.FLAG_TEXT:
+                return payload.decode('utf-8')
+            return payload
+        if stop_code is None:
+            return None
+
+        count = 4096
+        while True:
+            symbols = reader(count)
+            data = Steganography.symbols_to_bytes(symbols, lsb)
+            stop = data.find(stop_code)
+            if stop != -1:
+                return data[:stop].decode('latin-1')
+            if len(symbols) < count:
+                return data.decode('latin-1')
+            count *= 2
+
+    @staticmethod
+    def sample_lsb_view(frame_bytes, sample_width):
+        """
+        View the least significant byte of every little-endian PCM sample in frame_bytes. For up to 8 LSBs this is
+        the same as masking the samples as int16/int32, and it also covers 8-bit and 24-bit WAVs.
+        Writable if frame_bytes is
+        """
+        return np.frombuffer(frame_bytes, dtype=np.uint8).reshape(-1, sample_width)[:, 0]
+
+    @staticmethod
+    def message_to_bytes(msg):
+        """
+        Turn a message into (payload bytes, container flags). A str is stored as UTF-8 text, while bytes-like
+        objects, binary file-likes and paths (os.PathLike) are stored as raw binary
+        """
+        if isinstance(msg, str):
+            return msg.encode('utf-8'), container.FLAG_TEXT
+        if isinstance(msg, os.PathLike):
+            with open(msg, 'rb') as file:
+                return file.read(), 0
+        if hasattr(msg, 'read'):
+            data = msg.read()
+            if isinstance(data, str):
+                return data.encode('utf-8'), container.FLAG_TEXT
+            return data, 0
+        return memoryview(msg).cast('B'), 0
+
+    @staticmethod
+    def bytes_to_bits(data):
+        """
+        Unpack a bytes-like object into an array of bits, MSB first
+        """
+        return np.unpackbits(np.frombuffer(memoryview(data).cast('B'), dtype=np.uint8))
+
+    @staticmethod
+    def bytes_to_symbols(data, lsb):
+        """
+        Split the bits of data (MSB first) into lsb-wide symbols, zero padding the last one on the right
+        """
+        bits = Steganography.bytes_to_bits(data)
+        pad = -len(bits) % lsb
+        if pad:
+            bits = np.concatenate((bits, np.zeros(pad, dtype=np.uint8)))
+        weights = (1 << np.arange(lsb - 1, -1, -1)).astype(np.uint8)
+        return (bits.reshape(-1, lsb) * weights).sum(axis=1, dtype=np.uint8)
+
+    @staticmethod
+    def symbols_to_bytes(symbols, lsb):
+        """
+        Join lsb-wide symbols back into a bit stream and pack it into bytes, dropping any trailing partial byte
+        """
+        bits = np.unpackbits(np.asarray(symbols, dtype=np.uint8).reshape(-1, 1), axis=1)[:, 8 - lsb:].reshape(-1)
+        return np.packbits(bits[:len(bits) - len(bits) % 8]).tobytes()
+
+    @staticmethod
+    def embed_symbols(channels, symbols, lsb):
+        """
+        Write the symbols into the LSBs of a (pixels, channels) view of any integer type in row-major order, in place
+        """
+        per_pixel = channels.shape[1]
+        full, rest = divmod(len(symbols), per_pixel)
+        clear_mask = np.invert(channels.dtype.type(Steganography.getMask(lsb)))
+        head = channels[:full]
+        head &= clear_mask
+        head |= symbols[:full * per_pixel].reshape(full, per_pixel)
+        if rest:
+            tail = channels[full, :rest]
+            tail &= clear_mask
+            tail |= symbols[full * per_pixel:]
     
     @staticmethod
-    def encode_steganography_video(path_to_cover_video, payload_text, num_lsb, output_directory):
+    def embed_bands(carrier, symbols, lsb, job):
+        """
+        Embed the symbols into a (carriers, channels) view band by band (about a million carriers each), reporting
+        progress in carriers through job (whose total is the number of carriers holding payload) and checking for
+        cancellation in between
+        """
+        per_row = carrier.shape[1]
+        payload_rows = math.ceil(len(symbols) / per_row)
+        for top in range(0, payload_rows, 1 << 20):
+            job.check()
+            bottom = min(payload_rows, top + (1 << 20))
+            Steganography.embed_symbols(carrier[top:bottom], symbols[top * per_row:bottom * per_row], lsb)
+            job.update(bottom, bottom * carrier.strides[0])
+
+    @staticmethod
+    def symbol_bands(read_rows, total_rows, first_rows, lsb, job):
+        """
+        Hand out the symbols of a carrier in bands of rows that double in size from first_rows, so only the rows
+        carrying the payload are read. read_rows(top, bottom) returns the (carriers, channels) view of those rows.
+        Progress is reported in rows through job
+        """
+        mask = Steganography.getMask(lsb)
+        top, rows, processed_bytes = 0, first_rows, 0
+        while top < total_rows:
+            job.check()
+            band = read_rows(top, min(total_rows, top + rows))
+            processed_bytes += len(band) * band.strides[0]
+            yield (band & mask).astype(np.uint8, copy=False).reshape(-1)
+            top, rows = top + rows, rows * 2
+            job.update(min(top, total_rows), processed_bytes)
+
+    @staticmethod
+    def encode_steganography_video(path_to_cover_video, payload_text, num_lsb, output_directory, workers=None, progress=None, cancel=None):
+        """
+        Encode the payload into the first frames of the video. Progress is reported in frames of the output video,
+        cancelling stops both ffmpeg processes and removes the partial output
+        """
         try:
-            print("Initiating video encoding...")
             try:
                 number_of_lsb = int(num_lsb)
             except ValueError:
                 raise ValueError(f"num_lsb should be an integer, got: {num_lsb}")
-            print(f"Encoding with {number_of_lsb} LSBs")
-    
-            Steganography.extract_frames_from_video(path_to_cover_video)
-    
-            temporary_folder = "./temporary/"
-            frame_files = sorted([file for file in os.listdir(temporary_folder) if file.endswith('.png')], key=lambda file: int(file.split('.')[0]))
-    
-            payload_bits = ''.join([format(ord(char), '08b') for char in payload_text])
-            payload_bits += '00000000' * 8  # Adding 8 null bytes to signify the end of the message
-            bit_counter = 0
+            logger.info("Encoding video with %d LSBs", number_of_lsb)
     
-            total_frames = len(frame_files)
-            for frame_index, frame_file in enumerate(frame_files):
-                frame = cv2.imread(os.path.join(temporary_folder, frame_file))
-                if bit_counter >= len(payload_bits):
-                    break  # Stop encoding if all payload bits are encoded
-                for row in range(frame.shape[0]):
-                    for col in range(frame.shape[1]):
-                        for channel in range(3):  # Iterate over the BGR channels
-                            if bit_counter < len(payload_bits):
-                                frame[row, col, channel] = (frame[row, col, channel] & ~((1 << num_lsb) - 1)) | int(payload_bits[bit_counter:bit_counter + num_lsb], 2)
-                                bit_counter += num_lsb
+            with stage("bitify", media="video") as event:
+                payload, flags = Steganography.message_to_bytes(payload_text)
+                payload_symbols = Steganography.bytes_to_symbols(container.pack(payload, number_of_lsb, flags), number_of_lsb)
+                event["bytes"] = len(payload)
     
-                cv2.imwrite(os.path.join(temporary_folder, frame_file), frame)
-                print(f"\rProcessed frame {total_frames} of {total_frames}", end="")
-    
-            frames_per_second = VideoFileClip(path_to_cover_video).fps
-    
-            print("\nExtracting audio...")
-            audio_extraction_command = f'ffmpeg\\bin\\ffmpeg -i "{path_to_cover_video}" -q:a 0 -map a temporary/audio.mp3 -y -loglevel error'
-            audio_extraction_result = os.system(audio_extraction_command)
-            if audio_extraction_result != 0:
-                print(f"Error extracting audio with command: {audio_extraction_command}")
-                return {"status": False, "message": "Error extracting audio from the video"}
+            with stage("capacity", media="video", bytes=len(payload)) as event:
+                width, height, frames_per_second, total_frames = Steganography.probe_video(path_to_cover_video)
+                frame_symbols = width * height * 3
+                event["frames"] = total_frames
+            if total_frames and len(payload_symbols) > frame_symbols * total_frames:
+                return {"status": False, "message": "Payload is too large to hide in the selected video"}
     
             steganography_video_path = os.path.join(output_directory, os.path.basename(path_to_cover_video).split('.')[0] + '_stego.mp4')
-            print(f"Stego video path: {steganography_video_path}")
-    
-            print("Combining new video and audio...")
-            combine_video_command = f'ffmpeg\\bin\\ffmpeg -framerate {frames_per_second} -i temporary/%d.png -codec copy -y temporary/video-only.mp4 -loglevel error'
-            combine_video_result = os.system(combine_video_command)
-            if combine_video_result != 0 or not os.path.exists('temporary/video-only.mp4'):
-                print(f"Error combining video with command: {combine_video_command}")
-                return {"status": False, "message": "Error combining video frames"}
+            logger.info("Stego video path: %s", steganography_video_path)
     
-            combine_audio_command = f'ffmpeg\\bin\\ffmpeg -i temporary/video-only.mp4 -i temporary/audio.mp3 -codec copy -y "{steganography_video_path}" -loglevel error'
-            combine_audio_result = os.system(combine_audio_command)
-            if combine_audio_result != 0 or not os.path.exists(steganography_video_path):
-                print(f"Error combining audio with command: {combine_audio_command}")
-                return {"status": False, "message": "Error combining audio with video"}
-    
-            print("Deleting temporary folder...")
-            if os.path.exists("./temporary"):
+            # Only the frames carrying the payload are decoded from one ffmpeg process into a reusable BGR buffer,
+            # embedded in place and piped into a second ffmpeg process that writes them with the lossless PNG codec.
+            # The writer takes the remaining frames straight from the cover file, so they never pass through Python
+            payload_frames = math.ceil(len(payload_symbols) / frame_symbols)
+            logger.info("Payload needs %d of %s frames", payload_frames, total_frames)
+
+            # Frames are read into a shared batch (one frame per worker), embedded in parallel and written back in order.
+            # The workers are started before ffmpeg, so none of them holds on to the writer's stdin
+            batch_size = Steganography.worker_count(workers, payload_frames)
+            batch = FrameBatch([(height, width, 3)] * batch_size)
+            executor = Steganography.process_pool(batch_size)
+            try:
+                reader = Steganography.open_frame_reader(path_to_cover_video, payload_frames)
+                writer = Steganography.open_frame_writer(path_to_cover_video, steganography_video_path, width, height, frames_per_second, payload_frames)
+            except BaseException:
+                if executor is not None:
+                    executor.shutdown()
+                batch.close()
+                raise
+            symbol_counter = 0
+            frame_index = 0
+            timer = StageTimer("load", "embed", "serialize")
+            job = JobProgress(progress, cancel, total_frames)
+            written = {"frames": 0}
+            threading.Thread(target=Steganography.follow_ffmpeg_progress, args=(writer.stdout, written), daemon=True).start()
+            try:
+                while symbol_counter < len(payload_symbols):
+                    job.check()
+                    with timer("load"):
+                        frames_read = 0
+                        while frames_read < batch_size and Steganography.read_frame(reader.stdout, batch.frames[frames_read]):
+                            frames_read += 1
+                    if frames_read == 0:
+                        break
+                    with timer("embed"):
+                        batch_payload = payload_symbols[symbol_counter:symbol_counter + frames_read * frame_symbols]
+                        batch.embed(batch_payload, number_of_lsb, executor)
+                        symbol_counter += len(batch_payload)
+                    with timer("serialize"):
+                        for frame in batch.frames[:frames_read]:
+                            writer.stdin.write(frame.data)
+                    frame_index += frames_read
+                    job.update(frame_index, frame_index * frame_symbols)
+                    logger.info("Processed frame %d of %d", frame_index, payload_frames)
+                reader.stdout.close()
+                reader.wait()
+
+                # the writer finishes by copying the remaining frames and the audio across
+                with stage("mux", media="video") as event:
+                    writer.stdin.close()
+                    while True:
+                        try:
+                            writer.wait(timeout=0.25)
+                            break
+                        except subprocess.TimeoutExpired:
+                            done = max(frame_index, written["frames"])
+                            job.update(done, done * frame_symbols)
+                    if os.path.exists(steganography_video_path):
+                        event["bytes"] = os.path.getsize(steganography_video_path)
+            except BaseException:
+                # cancelled or failed: stop both ffmpeg processes and don't leave a partial video behind
+                for process in (reader, writer):
+                    if process.poll() is None:
+                        process.kill()
+                    process.wait()
+                if os.path.exists(steganography_video_path):
+                    os.remove(steganography_video_path)
+                raise
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+                batch.close()
+                reader.stdout.close()
                 try:
-                    shutil.rmtree("./temporary", onerror=Steganography.change_file_permissions)
-                    print("Temporary folder deleted successfully.")
-                except OSError as e:
-                    print(f"Error: {e.strerror} : {e.filename}")
+                    writer.stdin.close()
+                except BrokenPipeError:
+                    pass
+            timer.emit(media="video", frames=frame_index, bytes=frame_index * frame_symbols)
     
-            print("Encoding completed!")
-            return {"status": True, "message": f"Stego video created successfully at {steganography_video_path}"}
+            if symbol_counter < len(payload_symbols):
+                os.remove(steganography_video_path)
+                return {"status": False, "message": "Payload is too large to hide in the selected video"}
+            if writer.returncode != 0 or not os.path.exists(steganography_video_path):
+                return {"status": False, "message": f"Error writing stego video (ffmpeg exit code {writer.returncode})"}
     
+            if progress is not None: # the output is complete, so report it as such without checking for a cancel
+                progress(total_frames or frame_index, total_frames, (total_frames or frame_index) * frame_symbols)
+            logger.info("Encoding completed!")
+            return {"status": True, "message": f"Stego video created successfully at {steganography_video_path}", "output_path": steganography_video_path}
+    
+        except Cancelled:
+            return cancelled_result()
         except Exception as error:
             return {"status": False, "message": f"Error encoding video: {str(error)}"}
 
     @staticmethod
-    def change_file_permissions(operation, file_path, _):
-        os.chmod(file_path, stat.S_IWRITE)
-        operation(file_path)
+    def worker_count(workers, frame_count):
+        """
+        Number of processes worth starting to embed frame_count frames (defaults to one per CPU)
+        """
+        return max(1, min(workers or os.cpu_count() or 1, frame_count))
+
+    @staticmethod
+    def process_pool(worker_count):
+        """
+        Process pool with all of its workers already running, or None to embed in this process. The workers are
+        forked, so they have to start after the FrameBatch they share (or each one tracks, and removes, the shared
+        block on its own) but before any pipe they must not inherit is opened. They are only forked from the main
+        thread, as forking the worker thread of a GUI front end can deadlock the child
+        """
+        if worker_count <= 1:
+            return None
+        if threading.current_thread() is not threading.main_thread():
+            logger.info("Embedding in this process: worker processes are only started from the main thread")
+            return None
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=worker_count)
+        # pools may only start their workers on demand, so hand every one of them a task now
+        list(executor.map(abs, range(worker_count)))
+        return executor
+
+    @staticmethod
+    def frames_needed(symbols, frames):
+        """
+        Number of frames (arrays of shape (h, w, c)) the symbols reach into
+        """
+        remaining = len(symbols)
+        for index, frame in enumerate(frames):
+            remaining -= frame.shape[0] * frame.shape[1] * min(frame.shape[2], 3)
+            if remaining <= 0:
+                return index + 1
+        return len(frames)
+
+    @staticmethod
+    def ffmpeg_executable():
+        """
+        Locate ffmpeg: the bundled ffmpeg/bin build first, then PATH, then the binary shipped with imageio-ffmpeg
+        """
+        bundled = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'ffmpeg', 'bin', 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+        if os.path.exists(bundled):
+            return bundled
+        if shutil.which('ffmpeg'):
+            return shutil.which('ffmpeg')
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+
+    @staticmethod
+    def probe_video(path_to_video):
+        """
+        Return (width, height, fps, number of frames) of the first video stream
+        """
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+        infos = ffmpeg_parse_infos(path_to_video)
+        width, height = infos['video_size']
+        return width, height, infos['video_fps'], infos.get('video_nframes')
+
+    @staticmethod
+    def count_frames(path_to_video):
+        """
+        Count the frames of the first video stream by decoding it the way open_frame_reader does. The frame
+        count probe_video reads from the container is only an estimate
+        """
+        command = [Steganography.ffmpeg_executable(), '-nostdin', '-loglevel', 'error', '-i', path_to_video, '-map', '0:v:0',
+                   '-f', 'null', '-', '-progress', 'pipe:1', '-nostats']
+        counting = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        frames = [int(line[6:]) for line in counting.stdout.splitlines() if line.startswith(b'frame=')]
+        if counting.returncode != 0 or not frames:
+            raise ValueError("Could not determine the number of frames in the video")
+        return frames[-1]
+
+    @staticmethod
+    def open_frame_reader(path_to_video, frame_count=None):
+        """
+        Start an ffmpeg process that decodes the video (only the first frame_count frames if given)
+        to raw BGR frames on its stdout
+        """
+        command = [Steganography.ffmpeg_executable(), '-loglevel', 'error', '-i', path_to_video, '-map', '0:v:0']
+        if frame_count is not None:
+            command += ['-frames:v', str(frame_count)]
+        command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    @staticmethod
+    def open_frame_writer(path_to_cover_video, output_path, width, height, fps, piped_frames=None):
+        """
+        Start an ffmpeg process that encodes raw BGR frames from its stdin losslessly (PNG codec)
+        and copies the audio of the cover video alongside. If piped_frames is given, only that many
+        frames come from stdin and the rest of the video is passed through from the cover file
+        """
+        command = [Steganography.ffmpeg_executable(), '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                   '-i', path_to_cover_video]
+        if piped_frames is None:
+            command += ['-map', '0:v']
+        else:
+            # A stream can only hold one codec, so the untouched frames are still re-encoded, but ffmpeg
+            # decodes them itself instead of round-tripping them through the pipe
+            command += ['-filter_complex',
+                        '[0:v]format=rgb24,setsar=1[head];'
+                        f'[1:v:0]trim=start_frame={piped_frames},setpts=PTS-STARTPTS,format=rgb24,setsar=1[tail];'
+                        '[head][tail]concat=n=2:v=1:a=0[video]',
+                        '-map', '[video]']
+        command += ['-map', '1:a?', '-r', str(fps), '-c:v', 'png', '-c:a', 'copy', '-progress', 'pipe:1', '-nostats', '-y', output_path]
+        return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    @staticmethod
+    def follow_ffmpeg_progress(stream, written):
+        """
+        Read the -progress report of an ffmpeg process until it exits, keeping the number of frames
+        it has written in written["frames"]. The report has to be drained so ffmpeg never blocks on it
+        """
+        for line in stream:
+            if line.startswith(b'frame='):
+                written["frames"] = int(line[6:])
+        stream.close()
 
     @staticmethod
-    def extract_frames_from_video(path_to_video):
-        if not os.path.exists("./temporary"):
-            os.makedirs("./temporary")
-        temporary_folder = "./temporary/"
-        video_clip = VideoFileClip(path_to_video)
-        for frame_number, frame in enumerate(video_clip.iter_frames()):
-            print(f"Processing frames... (Frame {frame_number})")
-            image = Image.fromarray(frame, 'RGB')
-            image.save(f'{temporary_folder}{frame_number}.png')
+    def read_frame(stream, frame):
+        """
+        Fill the frame buffer with the next raw frame from stream, returns False once the stream is exhausted
+        """
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = stream.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
 
     @staticmethod
-    def decode_steganography_video(path_to_steganography_video, num_lsb):
+    def decode_steganography_video(path_to_steganography_video, num_lsb, progress=None, cancel=None):
         try:
-            print("Initiating video decoding...")
             number_of_lsb = int(num_lsb)
-            print(f"Decoding with {number_of_lsb} LSBs")
-    
-            Steganography.extract_frames_from_video(path_to_steganography_video)
-    
-            temporary_folder = "./temporary/"
-            frame_files = sorted([file for file in os.listdir(temporary_folder) if file.endswith('.png')], key=lambda file: int(file.split('.')[0]))
+            logger.info("Decoding video with %d LSBs", number_of_lsb)
     
-            payload_bits = ''
+            width, height, _, total_frames = Steganography.probe_video(path_to_steganography_video)
+            mask = Steganography.getMask(number_of_lsb)
     
-            total_frames = len(frame_files)
-            for frame_file in frame_files:
-                frame = cv2.imread(os.path.join(temporary_folder, frame_file))
-                for row in range(frame.shape[0]):
-                    for col in range(frame.shape[1]):
-                        for channel in range(3):  # Iterate over the BGR channels
-                            bits = format(frame[row, col, channel] & ((1 << num_lsb) - 1), f'0{num_lsb}b')
-                            payload_bits += bits
-                            if payload_bits.endswith('00000000' * 8):
-                                decoded_message = ''.join([chr(int(payload_bits[i:i + 8], 2)) for i in range(0, len(payload_bits) - 64, 8)])
-                                if os.path.exists("./temporary"):
-                                    try:
-                                        shutil.rmtree("./temporary", onerror=Steganography.change_file_permissions)
-                                        print("Temporary folder deleted successfully.")
-                                    except OSError as error:
-                                        print(f"Error: {error.strerror} : {error.filename}")
-                                with open("decoded_message.txt", "w") as file:
-                                    file.write(decoded_message)
-                                print("Decoding completed!")
-                                return {"status": True, "message": "Check decoded_message.txt for the decoded message."}
+            # Frames are pulled from the ffmpeg pipe one at a time, only until the payload has been recovered
+            reader = Steganography.open_frame_reader(path_to_steganography_video)
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            job = JobProgress(progress, cancel, total_frames)
     
-            print(f"\rProcessed frame {total_frames} / {total_frames}")
+            def frame_channels():
+                frame_index = 0
+                while True:
+                    job.check()
+                    if not Steganography.read_frame(reader.stdout, frame):
+                        break
+                    frame_index += 1
+                    job.update(frame_index, frame_index * frame.size)
+                    yield frame.reshape(-1) & mask
     
-            if os.path.exists("./temporary"):
-                try:
-                    shutil.rmtree("./temporary", onerror=Steganography.change_file_permissions)
-                    print("\nTemporary folder deleted successfully.")
-                except OSError as error:
-                    print(f"Error: {error.strerror} : {error.filename}")
+            try:
+                # 8 null bytes were the stop code before the container header
+                with stage("extract", media="video") as event:
+                    decoded_message = Steganography.read_message(SymbolReader(frame_channels()), number_of_lsb, b'\x00' * 8)
+                    event["bytes"] = len(decoded_message)
+            finally:
+                # stop demuxing as soon as we have what we need
+                reader.kill()
+                reader.stdout.close()
+                reader.wait()
     
-            return ''
+            with stage("save", media="video", bytes=len(decoded_message)):
+                with open("decoded_message.txt", "wb" if isinstance(decoded_message, bytes) else "w") as file:
+                    file.write(decoded_message)
+            logger.info("Decoding completed!")
+            return {"status": True, "message": "Check decoded_message.txt for the decoded message.", "output_path": "decoded_message.txt"}
     
+        except Cancelled:
+            return cancelled_result()
         except Exception as error:
-            return {"status": False, "message": f"Error decoding video: {str(error)}"}
\ No newline at end of file
+            return {"status": False, "message": f"Error decoding video: {str(error)}"}
+
+
+# Built-in media types. Images and GIFs are read with Pillow, WAVs with the wave module and videos with ffmpeg;
+# JPEG covers can be encoded (the stego image is written as PNG) but a JPEG can never carry a payload itself.
+# ffmpeg reads and writes videos as files, so they are the one type that can't be handled in memory
+media.register(media.MediaAdapter(
+    'PNG/BMP image', media.starts_with(media.PNG, media.BMP), ('encode', 'decode', 'tk_layout', 'memory'),
+    encode=Steganography.encode_image, decode=Steganography.decode_image, capacity=Steganography.image_capacity))
+media.register(media.MediaAdapter(
+    'JPEG image', media.starts_with(media.JPEG), ('encode', 'memory'),
+    encode=Steganography.encode_image, capacity=Steganography.image_capacity))
+media.register(media.MediaAdapter(
+    'GIF', media.starts_with(*media.GIF), ('encode', 'decode', 'workers', 'gif_mode', 'memory'),
+    encode=lambda path, msg, lsb, output_dir, progress, cancel, workers=None, gif_mode='rgb':
+        Steganography.encode_gif(path, msg, lsb, output_dir, workers, gif_mode, progress, cancel),
+    decode=Steganography.decode_gif, capacity=Steganography.gif_capacity))
+media.register(media.MediaAdapter(
+    'WAV audio', media.wave_pcm, ('encode', 'decode', 'audio_mode', 'memory'),
+    encode=lambda path, msg, lsb, output_dir, progress, cancel, audio_mode='stream':
+        Steganography.encode_audio(path, msg, lsb, output_dir, audio_mode, progress, cancel),
+    decode=Steganography.decode_audio, capacity=Steganography.audio_capacity))
+media.register(media.MediaAdapter(
+    'MP4/MOV/MKV/AVI video', lambda head: media.iso_media(head) or head.startswith(media.EBML) or media.riff(b'AVI ')(head),
+    ('encode', 'decode', 'workers'),
+    encode=lambda path, msg, lsb, output_dir, progress, cancel, workers=None:
+        Steganography.encode_steganography_video(path, msg, lsb, output_dir, workers, progress, cancel),
+    decode=Steganography.decode_steganography_video, capacity=Steganography.video_capacity))
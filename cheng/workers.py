@@ -0,0 +1,149 @@
+"""
+Background jobs for the Qt encoder and decoder windows. Steganography calls run on a QThreadPool so the
+window stays responsive, and JobPanel shows the running job with a progress bar, ETA, throughput and a
+Cancel button. Jobs submitted while one is running are queued and run one after another.
+"""
+import time
+from PyQt5.QtCore import QCoreApplication, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QProgressBar, QPushButton
+from jobs import CancelToken
+
+
+class JobSignals(QObject):
+    started = pyqtSignal()
+    # (items done, total items or None, bytes processed) as reported by Steganography
+    progress = pyqtSignal(object, object, object)
+    # the result dict of the job
+    result = pyqtSignal(dict)
+    finished = pyqtSignal()
+
+
+class StegoJob(QRunnable):
+    """
+    Run one Steganography call on a pool thread. function is called with the given arguments plus
+    progress and cancel keyword arguments, its result is emitted through signals.result
+    """
+    def __init__(self, name, function, *args, **kwargs):
+        super().__init__()
+        # the panel keeps the job until it has finished, Qt must not delete it under us
+        self.setAutoDelete(False)
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel = CancelToken()
+        self.signals = JobSignals()
+
+    def run(self):
+        self.signals.started.emit()
+        try:
+            result = self.function(*self.args, progress=self.signals.progress.emit, cancel=self.cancel, **self.kwargs)
+        except Exception as e:
+            result = {"status": False, "message": str(e)}
+        self.signals.result.emit(result)
+        self.signals.finished.emit()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class JobPanel(QWidget):
+    """
+    Progress bar, ETA/throughput line and Cancel button for the jobs of one window. Hidden while idle
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # a single thread, so queued jobs run in the order they were submitted
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.jobs = []
+        self.started_at = None
+        # don't keep the application alive for the rest of a job once the window is closed
+        QCoreApplication.instance().aboutToQuit.connect(self.cancel_all)
+
+        layout = QVBoxLayout(self)
+        self.statusLabel = QLabel()
+        self.statusLabel.setStyleSheet("margin-left: 10px;font-style: italic;")
+        layout.addWidget(self.statusLabel)
+
+        progressLayout = QHBoxLayout()
+        self.progressBar = QProgressBar()
+        self.progressBar.setStyleSheet("margin-left: 10px;")
+        progressLayout.addWidget(self.progressBar)
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.setStyleSheet("font-size: 15px;padding: 5px;")
+        self.cancelButton.clicked.connect(self.cancel_current)
+        progressLayout.addWidget(self.cancelButton)
+        layout.addLayout(progressLayout)
+
+        self.rateLabel = QLabel()
+        self.rateLabel.setStyleSheet("margin-left: 10px;")
+        layout.addWidget(self.rateLabel)
+        self.hide()
+
+    def submit(self, job, on_result):
+        """
+        Queue a job, on_result is called with its result dict on the GUI thread
+        """
+        job.signals.started.connect(lambda: self.job_started(job))
+        job.signals.progress.connect(self.job_progress)
+        job.signals.result.connect(on_result)
+        job.signals.finished.connect(lambda: self.job_finished(job))
+        self.jobs.append(job)
+        self.pool.start(job)
+        self.update_status()
+        self.show()
+
+    def cancel_current(self):
+        if self.jobs:
+            self.jobs[0].cancel.cancel()
+            self.cancelButton.setEnabled(False)
+            self.rateLabel.setText("Cancelling...")
+
+    def cancel_all(self):
+        """
+        Drop the queued jobs, cancel the running one and wait for it to clean up
+        """
+        self.pool.clear()
+        for job in self.jobs:
+            job.cancel.cancel()
+        self.pool.waitForDone()
+
+    def update_status(self):
+        if not self.jobs:
+            return
+        queued = len(self.jobs) - 1
+        self.statusLabel.setText(f"{self.jobs[0].name}" + (f" ({queued} more queued)" if queued else ""))
+
+    def job_started(self, job):
+        self.started_at = time.monotonic()
+        self.progressBar.setRange(0, 0) # busy until the first progress report
+        self.cancelButton.setEnabled(True)
+        self.rateLabel.setText("Starting...")
+        self.update_status()
+
+    def job_progress(self, done, total, processed_bytes):
+        if self.jobs and self.jobs[0].cancel.cancelled:
+            return
+        elapsed = time.monotonic() - self.started_at
+        rate = f"{processed_bytes / elapsed / 1_000_000:.1f} MB/s" if elapsed > 0 else ""
+        if not total:
+            self.progressBar.setRange(0, 0)
+            self.rateLabel.setText(rate)
+            return
+        # QProgressBar takes ints, so the bar counts tenths of a percent rather than items
+        self.progressBar.setRange(0, 1000)
+        self.progressBar.setValue(min(1000, done * 1000 // total))
+        if done:
+            remaining = elapsed * (total - done) / done
+            self.rateLabel.setText(f"{rate}, about {format_duration(remaining)} left")
+
+    def job_finished(self, job):
+        self.jobs.remove(job)
+        if self.jobs:
+            self.update_status()
+        else:
+            self.hide()
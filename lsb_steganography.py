@@ -1,9 +1,26 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
+from tkinter.scrolledtext import ScrolledText
 from tkinterdnd2 import TkinterDnD, DND_FILES
 from PIL import Image, ImageTk
-import numpy as np
-import wave
+import os
+import pathlib
+import queue
+import sys
+import threading
+
+# The embedding itself is done by the engine shared with the Qt encoder/decoder under cheng/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cheng'))
+from steganography import Steganography
+
+# the stego image is shown in the window rather than in the system viewer
+Steganography.OPEN_OUTPUT = False
+
+# Jobs run on a worker thread and never touch the widgets: they put messages on this queue, which the mainloop
+# polls every POLL_MS milliseconds. ("progress", stage, done, total), ("stego", path), ("done", text), ("error", text)
+job_messages = queue.Queue()
+POLL_MS = 100
+worker = None
 
 # Function to select a file
 def select_file(file_type):
@@ -30,7 +47,7 @@ def display_image(file_path, canvas):
     canvas.image = img  # Keep a reference to avoid garbage collection
     canvas.create_image(150, 150, image=img)
 
-# Function to encode text into an image
+# Function to encode a payload into a cover file (image, audio, GIF or video)
 def encode():
     cover_path = cover_file_label.cget("text")
     payload_path = payload_file_label.cget("text")
@@ -46,52 +63,27 @@ def encode():
         messagebox.showerror("Error", "Please select both cover and payload files.")
         return
     
-    # Load cover image
-    cover_image = Image.open(cover_path)
-    cover_array = np.array(cover_image)
+    run_in_background(encode_file, cover_path, payload_path, bits)
 
-    # Read payload text
-    with open(payload_path, 'r') as file:
-        payload = file.read()
-    
-    # Convert payload to binary
-    payload_bin = ''.join(format(ord(char), '08b') for char in payload)
-    payload_len = len(payload_bin)
 
-    # Check if payload can be hidden in cover image
-    if payload_len > cover_array.size * bits:
-        messagebox.showerror("Error", "Payload is too large to hide in the selected cover image.")
-        return
-    
-    # Encode payload into cover image
-    flat_cover_array = cover_array.flatten()
-    for i in range(0, payload_len, bits):
-        byte = flat_cover_array[i//bits]
-        for bit_index in range(bits):
-            if (i + ((bits-1)-bit_index)) < payload_len:
-                # to get the replacement bit from payload_bin at the index corresponding with the bit_index 
-                bit = int(payload_bin[i + ((bits-1)-bit_index)])
-                # create the mask to clear the bit at the specified bit_index, depending on how many LSBs selected
-                mask = ~(1 << bit_index)
-                # AND the mask, to clear the bit at the specific index
-                clearedByte = byte & mask
-                # move the replacement bit to specific index position
-                positionedReplacementBit = bit << bit_index
-                # OR the positioned replacement bit, to set the bit at the specified index of frame byte with the replacement bit
-                byte = clearedByte | positionedReplacementBit
-                # byte = (byte & ~(1 << bit_index)) | (bit << bit_index)
-        flat_cover_array[i//bits] = byte
+# Worker side of encode()
+def encode_file(cover_path, payload_path, bits):
+    # text files are hidden as text, anything else is hidden as raw bytes
+    if payload_path.lower().endswith('.txt'):
+        with open(payload_path, 'r') as file:
+            payload = file.read()
+    else:
+        payload = pathlib.Path(payload_path)
     
-    stego_array = flat_cover_array.reshape(cover_array.shape)
-    stego_image = Image.fromarray(stego_array)
-    stego_image_path = "stego_image.png"
-    stego_image.save(stego_image_path)
-    stego_file_label.config(text=stego_image_path)
-    display_image(stego_image_path, stego_canvas)
-    messagebox.showinfo("Success", "Payload has been successfully encoded into the cover image.")
+    # the stego file is written to the working directory
+    result = Steganography.encode(cover_path, payload, bits, os.getcwd(), progress=engine_progress("Encoding"))
+    if not result["status"]:
+        raise ValueError(result["message"])
+    job_messages.put(("stego", result["output_path"]))
+    return result["message"]
     
     
-# Function to decode text from an image
+# Function to decode a payload from a stego file
 def decode():
     stego_path = stego_file_label.cget("text")
     try:
@@ -106,130 +98,93 @@ def decode():
         messagebox.showerror("Error", "Please select a stego file.")
         return
     
-    # Load stego image
-    stego_image = Image.open(stego_path)
-    stego_array = np.array(stego_image)
-    
-    # Extract payload from stego image
-    flat_stego_array = stego_array.flatten()
-    payload_bin = ''
-    mask = getMask(bits)
-    for i in range(0, flat_stego_array.size, bits):
-        byte = flat_stego_array[i//bits]
-        # for bit_index in range(bits):
-        #     # essentially popping bits from the right, one by one every iteration, but then the bits are appended in reversed order, so wrong payload
-        #     bit = (byte >> bit_index) & 1
-        #     payload_bin += str(bit)
-        byte = byte & mask
-        bin = format(byte, 'b').rjust(bits, '0')
-        payload_bin += bin
-    
-    # Convert binary payload to text
-    payload = ''
-    for i in range(0, len(payload_bin), 8):
-        byte = payload_bin[i:i+8]
-        if len(byte) == 8:
-            char = chr(int(byte, 2))
-            payload += char
-    
-    messagebox.showinfo("Decoded Payload", f"Decoded text: {payload}")
+    run_in_background(decode_file, stego_path, bits)
+
+
+# Worker side of decode()
+def decode_file(stego_path, bits):
+    # tk_layout: stego images this tool wrote before it used the engine still decode, alpha channel included
+    result = Steganography.decode(stego_path, bits, progress=engine_progress("Extracting"), tk_layout=True)
+    if not result["status"]:
+        raise ValueError(result["message"])
+    # the decoded payload (str or bytes), or where it was written for videos
+    return result["message"]
 
     
-# (outdated) Function to encode text into a .wav file
+# The engine picks the media adapter from the file contents, so the audio buttons work like encode/decode
 def WAV_encode():
-    cover_path = cover_file_label.cget("text")
-    payload_path = payload_file_label.cget("text")
-    
-    try:
-        LSB_bits = int(bits_entry.get())
-        if LSB_bits < 1 or LSB_bits > 8:
-            raise ValueError("Number of LSBs must be between 1 and 8.")
-    except ValueError as e:
-        messagebox.showerror("Error", str(e))
-        return
-    
-    if not cover_path or not payload_path:
-        messagebox.showerror("Error", "Please select both cover and payload files.")
-        return
-    
-    # Open cover_path as audio file
-    with wave.open(cover_path, 'rb') as audioCoverFile:
-        # Read audio data
-        frames = audioCoverFile.readframes(audioCoverFile.getnframes())
-        frame_array = bytearray(frames) 
-    
-        # Read payload text
-        with open(payload_path, 'r') as file:
-            payload = file.read()
-            
-            # Convert payload to binary
-            payload_bin = ''.join([ format(ord(char), '08b') for char in payload ])
-            payload_len = len(payload_bin)
-                
-            # Check if payload can be hidden in cover image, every byte = 8 bits
-            if payload_len > len(frame_array) * 8: 
-                messagebox.showerror("Error", "Payload is too large to hide in the selected cover image.")
-                return
-            
-            # Encode secret data into LSB of audio frames
-            data_index = 0
-            for i in range(len(frame_array)): # for every byte
-                for j in range(LSB_bits):  # for 0 to (LSBs input)-1
-                    if data_index < payload_len: # if have not reached last bit of payload
-                        # Get the next bit from secret data
-                        secretBit = (int(payload_bin[data_index]) >> j) & 1
-                        # replaces the j-th bit of frame byte with secretBit, be it 0 or 1
-                        frame_array[i] = (frame_array[i] & ~(1 << j)) | (secretBit << j)
-                        data_index += 1
-                    else:
-                        break
-                
-    # Write the modified audio data to a new file
-    stego_path = "output_audio_stego.wav"
-    with wave.open(stego_path, 'wb') as audio_out:
-        audio_out.setparams(audioCoverFile.getparams())
-        audio_out.writeframes(frame_array)
-        messagebox.showinfo("Encoded", "Payload written into audio cover file successfully")
-
+    encode()
         
-# (outdated) function to encode text into a .wav file
 def WAV_decode():
-    stego_path = stego_file_label.cget("text")
-    
-    try:
-        LSB_bits = int(bits_entry.get())
-        if LSB_bits < 1 or LSB_bits > 8:
-            raise ValueError("Number of LSBs must be between 1 and 8.")
-    except ValueError as e:
-        messagebox.showerror("Error", str(e))
-        return
-    
-    if not stego_path:
-        messagebox.showerror("Error", "Please select a stego file.")
+    decode()
+
+
+# Start a job on the worker thread, one job at a time
+def run_in_background(job, *args):
+    global worker
+    if worker is not None and worker.is_alive():
+        messagebox.showerror("Busy", "Please wait for the current job to finish.")
         return
-    
-    # Open the audio file for reading
-    with wave.open(stego_path, 'rb') as audioStegoFile:
-        # Read audio data
-        frames = audioStegoFile.readframes(audioStegoFile.getnframes())
-        frame_array = bytearray(frames)
-                    
-        # Extract payload from stego audio file
-        payload_bin = ''
-        for i in range(len(frame_array)):
-            for j in range(LSB_bits):
-                bit = (frame_array[i] >> j) & 1
-                payload_bin += str(bit)
-                
-        # Convert binary payload to text
-        payload = ''
-        for i in range(0, len(payload_bin), 8):
-            byte = payload_bin[i:i+8]
-            if len(byte) == 8:
-                char = chr(int(byte, 2))
-                payload += char
-        
-        messagebox.showinfo("Decoded Payload", f"Decoded text: {payload}")
+    progress_label.config(text="Starting...")
+    worker = threading.Thread(target=run_job, args=(job, args), daemon=True)
+    worker.start()
+
+
+# Worker thread body: the job's result or error goes back to the mainloop through the queue
+def run_job(job, args):
+    try:
+        job_messages.put(("done", job(*args)))
+    except Exception as e:
+        job_messages.put(("error", str(e)))
+
+
+# Called by the jobs, from the worker thread
+def report_progress(stage, done, total):
+    job_messages.put(("progress", stage, done, total))
+
+
+# Progress callback for the engine, which reports (done, total, bytes processed)
+def engine_progress(stage):
+    return lambda done, total, processed_bytes: report_progress(stage, done, total)
+
+
+# Handle the messages of the worker thread, then poll again
+def poll_jobs():
+    try:
+        while True:
+            message = job_messages.get_nowait()
+            if message[0] == "progress":
+                _, stage, done, total = message
+                progress_bar["value"] = 100 * done / total if total else 0
+                progress_label.config(text=f"{stage}... {100 * done // total if total else 0}%")
+            elif message[0] == "stego":
+                stego_file_label.config(text=message[1])
+                if message[1].lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
+                    display_image(message[1], stego_canvas)
+            elif message[0] == "done":
+                progress_bar["value"] = 100
+                progress_label.config(text="Done")
+                show_result(message[1])
+            elif message[0] == "error":
+                progress_bar["value"] = 0
+                progress_label.config(text="Failed")
+                messagebox.showerror("Error", message[1])
+    except queue.Empty:
+        pass
+    root.after(POLL_MS, poll_jobs)
+
+
+# Results go in the scrollable text box, a messagebox can't show a multi-megabyte decoded payload
+def show_result(text):
+    if isinstance(text, bytes):
+        # binary payload, let the user choose where to save it
+        file_path = filedialog.asksaveasfilename(title="Save decoded payload", initialfile="decoded_payload.bin")
+        if file_path:
+            with open(file_path, 'wb') as file:
+                file.write(text)
+        text = f"Decoded {len(text)} bytes of binary payload" + (f" to {file_path}" if file_path else "")
+    result_text.delete("1.0", tk.END)
+    result_text.insert(tk.END, text)
 
 
 # Function to handle drag-and-drop events
@@ -240,26 +195,6 @@ def drop(event, file_type):
     update_file_label(file_path, file_type)
     
     
-def getMask(lsb):
-        match(lsb):
-            case 1:
-                return 1
-            case 2:
-                return 3
-            case 3:
-                return 7
-            case 4:
-                return 15
-            case 5:
-                return 31
-            case 6:
-                return 63
-            case 7:
-                return 127
-            case 8:
-                return 255
-
-
 # Main GUI setup
 root = TkinterDnD.Tk()
 root.title("LSB Steganography")
@@ -325,4 +260,16 @@ tk.Button(second_frame, text="Decode", command=decode).grid(row=3, column=3, pad
 tk.Button(second_frame, text="Encode Audio File", command=WAV_encode).grid(row=3, column=4, padx=10, pady=10)
 tk.Button(second_frame, text="Decode Audio File", command=WAV_decode).grid(row=3, column=5, padx=10, pady=10)
 
+# Progress of the running job
+progress_bar = ttk.Progressbar(second_frame, length=300, maximum=100)
+progress_bar.grid(row=4, column=1, padx=10, pady=10)
+progress_label = tk.Label(second_frame, text="")
+progress_label.grid(row=4, column=2, padx=10, pady=10)
+
+# Results of the jobs (e.g. the decoded payload)
+tk.Label(second_frame, text="Result:").grid(row=5, column=0, padx=10, pady=10, sticky="n")
+result_text = ScrolledText(second_frame, width=80, height=15, wrap=tk.CHAR)
+result_text.grid(row=5, column=1, columnspan=5, padx=10, pady=10, sticky="we")
+
+root.after(POLL_MS, poll_jobs)
 root.mainloop()
\ No newline at end of file